@@ -4,23 +4,35 @@
 @author: mirko
 '''
 
-import pyorient
+from threading import Lock
 from pyarabic import araby
 from ResultSet import ResultSet
-from WrappedRecord import WrappedNode, WrappedEdge
+from WrappedRecord import WrappedRecord, WrappedNode, WrappedEdge
+from BulkLoader import BulkLoader
+from Statement import Statement
+from ConnectionPool import ConnectionPool
+from SubgraphCache import SubgraphCache
+from Tracer import Tracer
 import Tools
 
 
+# Statements have placeholders, which Statement replaces by escaped literals
+# on the client. Index and class names are interpolated with "%".
+
 SQL_GET_NODE = """
-select from %s 
+select from #? 
 """
 
 SQL_SEARCH = """
-SELECT EXPAND(rid) FROM index:%s where key = '%s'
+SELECT EXPAND(rid) FROM index:%s where key = ?
+"""
+
+SQL_GET_FOREIGN_NODES_BY_SOURCE = """
+select from ForeignNode where source = ?
 """
 
 SQL_SEARCH_BY_TRANSLATION = """
-SELECT expand(rid.in()) from index:Node.label where key = '%s'
+SELECT expand(rid.in()) from index:Node.label where key = ?
 """
 
 # A node's subgraph is the subgraph induced by all words derived from the same
@@ -29,17 +41,60 @@ SELECT expand(rid.in()) from index:Node.label where key = '%s'
 # HACK: There must be a decent way to get these subgraphs
 SQL_GET_NODE_FETCH_SUBGRAPH = """
 select expand(bothE()) from (
-    traverse both(), bothE() FROM [ %s ]
+    traverse both(), bothE() FROM #?
     while @class <> 'ForeignNode' )
 """
 
 SQL_SEARCH_FETCH_SUBGRAPHS = """
 select expand(bothE()) from (
     traverse both(), bothE() from (
-        SELECT EXPAND(rid) FROM index:%s where key = '%s' )
+        SELECT EXPAND(rid) FROM index:%s where key = ? )
     while @class <> 'ForeignNode' ) 
 """
 
+# Nodes of the subgraphs without edge records, see ResultSet.add_edges_from_ridbags
+SQL_GET_NODE_FETCH_TOPOLOGY = """
+select expand(both()) from (
+    traverse both() FROM #?
+    while @class <> 'ForeignNode' )
+"""
+
+# Root families materialized as single documents, see update_root_families()
+SQL_GET_ROOT_FAMILY = """
+SELECT EXPAND(rid) FROM index:RootFamily.root_rid
+WHERE key IN (SELECT root_rid FROM #?)
+"""
+
+SQL_GET_ROOTS_OF = """
+select from (
+    traverse in() FROM #?
+    while @class <> 'ForeignNode' )
+where @class = 'Root'
+"""
+
+SQL_SET_ROOT_RID = """
+UPDATE ArabicNode SET root_rid = #? WHERE @rid IN #?
+"""
+
+SQL_UPSERT_ROOT_FAMILY = """
+UPDATE RootFamily SET root_rid = #?, records = ? UPSERT WHERE root_rid = #?
+"""
+
+SQL_GET_ROOTS = """
+select from Root
+"""
+
+SQL_SET_LAYOUT = """
+UPDATE #? SET layout = ?
+"""
+
+SQL_CREATE_NODE = """
+CREATE VERTEX %s CONTENT ?
+"""
+
+SQL_CREATE_EDGE = """
+CREATE EDGE %s FROM #? TO #? CONTENT ?
+"""
 
 
 class ArabicWordGraph(object):
@@ -49,14 +104,59 @@ class ArabicWordGraph(object):
     DEFAULT_FETCHPLAN = "*:1"
     DEFAULT_LIMIT = 1000
     
-    def __init__(self, db_name = "shabaka", db_user = "admin", db_pwd = "admin"):
+    def __init__(self, db_name = "shabaka", db_user = "admin", db_pwd = "admin",
+                 pool = None, subgraph_cache = None, root_families = False):
         """
-        Establishes connection to OrientDB
+        Establishes connection to OrientDB. Pass a ConnectionPool to share
+        connections between ArabicWordGraphs and threads, otherwise a pool
+        with a single connection is created. Bulk loads open one more
+        connection, see begin_bulk_load().
+        
+        Subgraphs of single nodes are cached in the given SubgraphCache (or in
+        a new one), which is invalidated on writes.
+        
+        If root_families is set, subgraphs are read from RootFamily documents.
+        Writes mark the families of the changed nodes as dirty, they are
+        updated on flush() or before the next RootFamily is read, see
+        update_dirty_root_families().
         
         """
-        self.client = pyorient.OrientDB()
-        r = self.client.db_open(db_name, db_user, db_pwd, pyorient.DB_TYPE_GRAPH)
-        self.cluster_ids = dict((c.name, c.id) for c in r)
+        if not pool:
+            pool = ConnectionPool(db_name, db_user, db_pwd, max_size = 1)
+        self.pool = pool
+        self.bulk_loader = None
+        # Called with the rids of created or connected nodes after writes
+        self.change_listeners = []
+        self.root_families = root_families
+        # Rids of the nodes whose root families are outdated
+        self.dirty_family_rids = set()
+        self.dirty_family_lock = Lock()
+        if root_families:
+            self.add_change_listener(self._mark_families_dirty)
+        if subgraph_cache is None:
+            subgraph_cache = SubgraphCache()
+        self.subgraph_cache = subgraph_cache
+        self.add_change_listener(subgraph_cache.invalidate)
+
+    def _query(self, query, limit, fetchplan, primary_pred = lambda x: True):
+        """ Runs query on a pooled connection, returning a ResultSet """
+        return self.pool.run(lambda client: ResultSet.from_query(
+                client, query, limit, fetchplan, primary_pred))
+
+    def _command(self, command):
+        """ Runs command on a pooled connection without retrying """
+        with self.pool.connection() as client:
+            return client.command(command)
+
+    def _run(self, f):
+        """
+        Calls f with the bulk loader's connection in bulk load mode, with a
+        pooled connection otherwise.
+        
+        """
+        if self.bulk_loader:
+            return f(self.bulk_loader.client)
+        return self.pool.run(f)
 
     def search_index(self, q, fetch_subgraph = True, index = "Node.label", 
                      limit = DEFAULT_LIMIT, fetchplan = DEFAULT_FETCHPLAN,
@@ -68,14 +168,14 @@ class ArabicWordGraph(object):
         
         """
         if fetch_subgraph:
-            query = SQL_SEARCH_FETCH_SUBGRAPHS % (index, q)
+            query = Statement.get(SQL_SEARCH_FETCH_SUBGRAPHS % index).bind(q)
         else:
-            query = SQL_SEARCH % (index, q)
+            query = Statement.get(SQL_SEARCH % index).bind(q)
 
         if not primary_pred:
             primary_pred = lambda x: x.data.get(index.split(".")[-1]) == q
 
-        rs = ResultSet.from_query(self.client, query, limit, fetchplan, primary_pred)
+        rs = self._query(query, limit, fetchplan, primary_pred)
         return rs
 
     def get_nodes(self, rids, fetch_subgraph = True, limit = DEFAULT_LIMIT,
@@ -86,6 +186,11 @@ class ArabicWordGraph(object):
         
         The nodes retrieved for the given rids are considered primary results.
         
+        The subgraph of a single node is served from the SubgraphCache if it
+        has been fetched before for any node of the same root family. It is
+        shared and must not be modified. Otherwise, it is read from the
+        RootFamily document if root_families is set.
+        
         You will get an empty resultset:
         - when retrieving a ForeignNode together with its subgraph
           (because "a node's subgraph" is only defined for ArabicNodes)
@@ -96,15 +201,145 @@ class ArabicWordGraph(object):
         if not rids:
             return ResultSet([])
         
+        primary_pred = lambda x: x.rid in rids
+        if fetch_subgraph and len(rids) == 1 and limit == self.DEFAULT_LIMIT \
+                and fetchplan == self.DEFAULT_FETCHPLAN:
+            rs = self.subgraph_cache.get(rids[0])
+            if rs is None and self.root_families:
+                rs = self.get_root_family(rids[0])
+                if rs is not None and rids[0] in rs.result_map:
+                    self.subgraph_cache.put(rs)
+                else:
+                    rs = None
+            if rs is None:
+                query = Statement.get(SQL_GET_NODE_FETCH_SUBGRAPH).bind(rids)
+                rs = self._query(query, limit, fetchplan, primary_pred)
+                if rids[0] in rs.result_map:
+                    self.subgraph_cache.put(rs)
+            return rs.with_primary_pred(primary_pred)
+
         if fetch_subgraph:
-            query = SQL_GET_NODE_FETCH_SUBGRAPH % ", ".join(rids)
+            query = Statement.get(SQL_GET_NODE_FETCH_SUBGRAPH).bind(rids)
         else:
-            query = SQL_GET_NODE % ",".join(rids)
-        rs = ResultSet.from_query(self.client, query, limit, fetchplan,
-                                  lambda x: x.rid in rids)
+            query = Statement.get(SQL_GET_NODE).bind(rids)
+        rs = self._query(query, limit, fetchplan, primary_pred)
         return rs
 
 
+    def get_root_family(self, rid, primary_pred = lambda x: True):
+        """
+        Returns the subgraph of the root family of the node with given rid as
+        stored in its RootFamily document, or None if there is none (e.g. for
+        ForeignNodes). Dirty root families are updated before.
+        
+        """
+        self.update_dirty_root_families()
+        tracer = Tracer.shared()
+        query = Statement.get(SQL_GET_ROOT_FAMILY).bind(rid)
+        with tracer.span("db_query"):
+            records = self.pool.run(lambda client: client.query(query, 1, "*:0"))
+        if not records:
+            return None
+        with tracer.span("resultset"):
+            return ResultSet.from_json(records[0].oRecordData["records"],
+                                       primary_pred)
+
+    def update_root_families(self, rids):
+        """
+        Materializes the subgraphs of the roots of the given nodes as
+        RootFamily documents, one per root, holding the records serialized
+        by ResultSet.to_json(). Stores the root's rid as root_rid with every
+        ArabicNode of these subgraphs. Returns the rids of the roots.
+        
+        This costs a traversal of the changed nodes, plus a fetch and an
+        upsert per root (two fetches if nodes lack root_rid). If root_families
+        is set, it is called for the nodes changed by writes, batched by
+        update_dirty_root_families(). Use update_all_root_families() to
+        materialize an existing graph.
+        
+        """
+        rids = [rid for rid in rids if not rid.startswith("$")]
+        if not rids:
+            return []
+
+        def update(client):
+            query = Statement.get(SQL_GET_ROOTS_OF).bind(rids)
+            roots = [r.rid for r in
+                     ResultSet.from_query(client, query, -1, "*:0").nodes]
+            for root in roots:
+                query = Statement.get(SQL_GET_NODE_FETCH_SUBGRAPH).bind(root)
+                rs = ResultSet.from_query(client, query, self.DEFAULT_LIMIT,
+                                          self.DEFAULT_FETCHPLAN)
+                unset = [n.rid for n in rs.nodes if n.cls != "ForeignNode"
+                         and getattr(n.data.get("root_rid"), "rid", None) != root]
+                if unset:
+                    client.command(Statement.get(SQL_SET_ROOT_RID)
+                                   .bind(root, unset))
+                    rs = ResultSet.from_query(client, query, self.DEFAULT_LIMIT,
+                                              self.DEFAULT_FETCHPLAN)
+                client.command(Statement.get(SQL_UPSERT_ROOT_FAMILY)
+                               .bind(root, rs.to_json(), root))
+            return roots
+        return self._run(update)
+
+    def _mark_families_dirty(self, rids):
+        with self.dirty_family_lock:
+            self.dirty_family_rids.update(rid for rid in rids
+                                          if not rid.startswith("$"))
+
+    def update_dirty_root_families(self):
+        """
+        Updates the root families of all nodes changed since the last update
+        at once, see update_root_families(), so that a series of writes (or
+        of bulk load flushes) costs a single update. Readers wait for a
+        running update. Returns the rids of the updated roots.
+        
+        """
+        with self.dirty_family_lock:
+            if not self.dirty_family_rids:
+                return []
+            rids = list(self.dirty_family_rids)
+            roots = self.update_root_families(rids)
+            self.dirty_family_rids.difference_update(rids)
+            return roots
+
+    def update_all_root_families(self, chunk_size = 100):
+        """ Materializes the subgraphs of all roots, returns their number """
+        roots = [r.rid for r in self.get_roots().primary_results]
+        for i in range(0, len(roots), chunk_size):
+            self.update_root_families(roots[i:i + chunk_size])
+        return len(roots)
+
+    def get_topology(self, rids, limit = DEFAULT_LIMIT):
+        """
+        Returns a ResultSet consisting of the subgraphs of the nodes with
+        given rids like get_nodes(), but without fetching the edge records.
+        The nodes are connected by FakeEdges without data instead, see
+        ResultSet.add_edges_from_ridbags(). Nodes without edges are missing.
+        
+        Falls back to get_nodes() if the rids of some edges cannot be decoded
+        from the nodes' RidBags.
+        
+        """
+        if not rids:
+            return ResultSet([])
+
+        query = Statement.get(SQL_GET_NODE_FETCH_TOPOLOGY).bind(rids)
+        rs = self._query(query, limit, "*:0", lambda x: x.rid in rids)
+        if not rs.add_edges_from_ridbags():
+            rs = self.get_nodes(rids, limit = limit)
+        return rs
+
+    def get_edges(self, rids):
+        """
+        Returns a ResultSet consisting of the edges with given rids, e.g.
+        taken from WrappedNode.edge_rids(), without their endpoints.
+        
+        """
+        if not rids:
+            return ResultSet([])
+        return self._query(Statement.get(SQL_GET_NODE).bind(rids), -1, "*:0")
+
     def search_arabic(self, q, fetch_subgraph = True, limit = DEFAULT_LIMIT,
                       fetchplan = DEFAULT_FETCHPLAN):
         """
@@ -138,33 +373,76 @@ class ArabicWordGraph(object):
         whose label matches the query.
         
         """
-        sql = SQL_SEARCH_BY_TRANSLATION % q
-        return ResultSet.from_query(self.client, sql, limit, fetchplan) 
+        sql = Statement.get(SQL_SEARCH_BY_TRANSLATION).bind(q)
+        return self._query(sql, limit, fetchplan) 
+
+
+    def get_foreign_nodes(self, source, limit = -1):
+        """
+        Returns a ResultSet consisting of all ForeignNodes created from the
+        given source, e.g. "elixirfm". Does not fetch adjacent edges.
+        
+        """
+        sql = Statement.get(SQL_GET_FOREIGN_NODES_BY_SOURCE).bind(source)
+        return self._query(sql, limit, "*:0")
+
+    def get_roots(self, limit = -1):
+        """ Returns a ResultSet consisting of all Roots, without edges """
+        return self._query(SQL_GET_ROOTS, limit, "*:0")
+
+    def set_layout(self, rid, positions):
+        """
+        Stores precomputed node positions, a map rid -> "x,y" in points, as
+        property "layout" of the node with given rid (a root).
+        
+        """
+        self._command(Statement.get(SQL_SET_LAYOUT).bind(rid, positions))
+        self.subgraph_cache.invalidate([rid])
+
+    def add_change_listener(self, listener):
+        """
+        Registers listener to be called with a list of rids of the nodes
+        created or connected by a write, once it is committed.
+        
+        """
+        self.change_listeners.append(listener)
 
+    def _changed(self, rids):
+        for listener in self.change_listeners:
+            listener(rids)
     
     def create_node(self, _class, label, **kwargs):
         """
-        Creates node, handles conversion of unicode strings.
-        Returns a WrappedNode.
+        Creates node of given class, passing the properties as JSON.
+        Returns a WrappedNode, or a FakeNode with a temporary rid in bulk load
+        mode.
         
         """
-        # HACK: Why do we need to do this escaping?
-        kwargs["label"] = label.translate({ord("\\"): u"\\\\"})
-        r = self.client.record_create(self.cluster_ids[_class],
-                                      Tools.encode_map(kwargs))
-        return WrappedNode(r)
+        if self.bulk_loader:
+            return self.bulk_loader.create_node(_class, label = label, **kwargs)
+
+        kwargs["label"] = label
+        r = self._command(Statement.get(SQL_CREATE_NODE % _class).bind(kwargs))
+        n = WrappedNode(r[0])
+        self._changed([n.rid])
+        return n
 
     def create_edge(self, _class, src, tgt, **kwargs):
         """
         Creates edge of given class (string) between src and tgt either passed as
-        WrappedNodes or as RID strings. Returns a WrappedEdge.
+        WrappedNodes or as RID strings. Returns a WrappedEdge, or a FakeEdge
+        in bulk load mode.
         """
-        if type(src) == WrappedNode:
+        if isinstance(src, WrappedRecord):
             src = src.rid
-        if type(tgt) == WrappedNode:
+        if isinstance(tgt, WrappedRecord):
             tgt = tgt.rid
-        r = self.client.command("CREATE EDGE %s from %s to %s CONTENT %s" % 
-                                (_class, src, tgt, Tools.encode_map(kwargs)))
+        if self.bulk_loader:
+            return self.bulk_loader.create_edge(_class, src, tgt, **kwargs)
+
+        r = self._command(Statement.get(SQL_CREATE_EDGE % _class)
+                          .bind(src, tgt, kwargs))
+        self._changed([src, tgt])
         return WrappedEdge(r[0])
     
     def create_arabic_node(self, cluster_name, label, **kwargs):
@@ -193,6 +471,46 @@ class ArabicWordGraph(object):
         return (n, e)
 
 
+    ## ---------------------------------------------------------------------
+    ## Bulk loading
+
+    def begin_bulk_load(self, max_statements = BulkLoader.DEFAULT_MAX_STATEMENTS):
+        """
+        Switches to bulk load mode: Created nodes and edges are buffered and
+        sent in batches, see BulkLoader. Returned nodes carry temporary rids
+        until the next flush(). The BulkLoader gets a dedicated connection
+        outside of the pool until end_bulk_load(), so that reads on pooled
+        connections do not block while bulk loading, even with a pool of a
+        single connection.
+        
+        """
+        if not self.bulk_loader:
+            self.bulk_loader = BulkLoader(self.pool.connect_unpooled(),
+                                          max_statements)
+            self.bulk_loader.on_flush = self._changed
+        return self.bulk_loader
+
+    def flush(self):
+        """
+        Sends buffered creations to the db, if in bulk load mode, and updates
+        dirty root families
+        
+        """
+        if self.bulk_loader:
+            self.bulk_loader.flush()
+        self.update_dirty_root_families()
+
+    def end_bulk_load(self):
+        """ Flushes and leaves bulk load mode, returns the BulkLoader """
+        bulk_loader = self.bulk_loader
+        if bulk_loader:
+            try:
+                self.flush()
+            finally:
+                self.pool.close_unpooled(bulk_loader.client)
+                self.bulk_loader = None
+        return bulk_loader
+
     ## ---------------------------------------------------------------------
     ## Adding nodes to the graph an connecting them
     
@@ -240,3 +558,26 @@ if __name__ == '__main__':
         for n in r.secondary_results:
             print n.cls, n.rid, n.data["label"]
         print
+
+    # Per-query latency against the local db, before (SQL built by "%"
+    # interpolation, as the queries were written before Statement) and after
+    # (bound by Statement). Both send the same kind of SQL text, see
+    # Statement, so only the client-side binding differs.
+    import timeit
+    index = "ArabicNode.unvocalized_label"
+    queries = (
+        ("search_index", "SELECT EXPAND(rid) FROM index:%s where key = '%s'",
+         (index, u"فضل"), SQL_SEARCH % index, (u"فضل", )),
+        ("get_nodes", "select from %s", ("#15:39797", ),
+         SQL_GET_NODE, (["#15:39797"], )),
+        ("search_foreign", "SELECT expand(rid.in()) from index:Node.label where key = '%s'",
+         (u"write", ), SQL_SEARCH_BY_TRANSLATION, (u"write", )))
+    for (name, before_sql, before_params, sql, params) in queries:
+        before = lambda: G._query(before_sql % before_params,
+                                  ArabicWordGraph.DEFAULT_LIMIT, "*:0")
+        after = lambda: G._query(Statement.get(sql).bind(*params),
+                                 ArabicWordGraph.DEFAULT_LIMIT, "*:0")
+        (t_before, t_after) = [min(timeit.repeat(f, number = 100, repeat = 3)) / 100
+                               for f in (before, after)]
+        print "%s: %.2f ms/query before, %.2f ms/query after" \
+                % (name, t_before * 1000, t_after * 1000)
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import json, time
+from WrappedRecord import FakeNode, FakeEdge
+
+
+class BulkLoader(object):
+    """
+    Buffers node and edge creations and sends them to OrientDB as a single
+    batch script, i.e. a single transaction and a single round trip.
+
+    Nodes are returned as FakeNodes carrying a temporary rid like "$n42", which
+    is the name of the script variable the node is bound to. Edges may refer to
+    these temporary rids as long as the buffer has not been flushed. On flush,
+    the temporary rids are replaced by the real ones in place, so that nodes
+    can be kept and referenced by later batches.
+
+    If on_flush is set, it is called after every flush with the rids of the
+    created nodes and of the existing nodes new edges have been attached to.
+
+    The buffer is flushed automatically once it holds max_statements
+    statements. With max_statements None it is only flushed by flush(), so
+    that callers can make a unit of work (e.g. a chunk of roots) exactly one
+    transaction.
+
+    """
+    DEFAULT_MAX_STATEMENTS = 5000
+
+    def __init__(self, client, max_statements = DEFAULT_MAX_STATEMENTS):
+        self.client = client
+        self.max_statements = max_statements
+        self.statements = []
+        self.pending_nodes = []
+        # Existing nodes new edges are attached to
+        self.pending_endpoints = set()
+        self.next_var_id = 0
+        self.on_flush = None
+        # Statistics over all flushes
+        self.rows = 0
+        self.seconds = 0.0
+        self.batches = 0
+
+    def create_node(self, _class, **kwargs):
+        """ Buffers creation of a vertex, returns a FakeNode """
+        n = FakeNode(rid = self._new_var("n"), cls = _class, data = kwargs)
+        self.pending_nodes.append(n)
+        self._add_statement("let %s = CREATE VERTEX %s CONTENT %s"
+                            % (n.rid[1:], _class, self._encode(kwargs)))
+        return n
+
+    def create_edge(self, _class, src, tgt, **kwargs):
+        """
+        Buffers creation of an edge between src and tgt, which are rid strings
+        (either temporary or real ones). Returns a FakeEdge.
+
+        """
+        e = FakeEdge(src, tgt, rid = self._new_var("e"), cls = _class,
+                     data = kwargs)
+        self.pending_endpoints.update(r for r in (src, tgt)
+                                      if not r.startswith("$"))
+        self._add_statement("let %s = CREATE EDGE %s FROM %s TO %s CONTENT %s"
+                            % (e.rid[1:], _class, src, tgt, self._encode(kwargs)))
+        return e
+
+    def flush(self):
+        """
+        Sends buffered statements as one transaction and resolves temporary
+        rids of the created nodes. Raises a RuntimeError if the number of
+        created nodes does not match.
+
+        """
+        if not self.statements:
+            return
+
+        nodes = self.pending_nodes
+        endpoints = self.pending_endpoints
+        script = ["begin"] + self.statements + ["commit retry 100"]
+        script.append("return [%s]" % ", ".join(n.rid for n in nodes))
+
+        t0 = time.time()
+        records = self.client.batch(";\n".join(script))
+        self.seconds += time.time() - t0
+        self.rows += len(self.statements)
+        self.batches += 1
+        self.statements = []
+        self.pending_nodes = []
+        self.pending_endpoints = set()
+
+        records = records or []
+        if len(records) != len(nodes):
+            raise RuntimeError("Batch created %d nodes, expected %d"
+                               % (len(records), len(nodes)))
+        for (n, r) in zip(nodes, records):
+            n.rid = r._OrientRecord__rid
+        if self.on_flush:
+            self.on_flush([n.rid for n in nodes] + list(endpoints))
+
+    def savepoint(self):
+        """
+        Returns a marker of the current buffer state, which rollback() can
+        return to, e.g. to drop the statements of a failed unit of work.
+
+        """
+        return (self.batches, len(self.statements), len(self.pending_nodes),
+                set(self.pending_endpoints))
+
+    def rollback(self, savepoint):
+        """
+        Drops the statements buffered since savepoint was taken. Raises a
+        RuntimeError if the buffer has been flushed in between, as flushed
+        statements cannot be taken back.
+
+        """
+        (batches, statements, nodes, endpoints) = savepoint
+        if batches != self.batches:
+            raise RuntimeError("Cannot roll back, buffer has been flushed "
+                               "since the savepoint")
+        del self.statements[statements:]
+        del self.pending_nodes[nodes:]
+        self.pending_endpoints = endpoints
+
+    @property
+    def rows_per_second(self):
+        """ Returns the throughput over all flushes so far """
+        if not self.seconds:
+            return 0.0
+        return self.rows / self.seconds
+
+    def _new_var(self, prefix):
+        self.next_var_id += 1
+        return "$%s%d" % (prefix, self.next_var_id)
+
+    def _add_statement(self, statement):
+        self.statements.append(statement)
+        if self.max_statements and len(self.statements) >= self.max_statements:
+            self.flush()
+
+    @staticmethod
+    def _encode(m):
+        """ Encodes a map as JSON, so that no escaping hacks are needed """
+        return json.dumps(m)
+
+    def __len__(self):
+        return len(self.statements)
@@ -0,0 +1,185 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import socket, time
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+
+import pyorient
+
+# Exceptions indicating that a connection cannot be used any longer
+CONNECTION_ERRORS = (pyorient.PyOrientConnectionException, socket.error)
+
+class PoolTimeout(RuntimeError):
+    """ Raised if no connection could be checked out in time """
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of OrientDB connections, as a pyorient client must not be
+    used by several threads at a time.
+
+    Between min_size and max_size connections are kept open. Connections idle
+    for more than health_check_interval seconds are checked before being
+    handed out, broken connections are replaced.
+
+    """
+    def __init__(self, db_name = "shabaka", db_user = "admin", db_pwd = "admin",
+                 host = "localhost", port = 2424, min_size = 1, max_size = 10,
+                 timeout = 10.0, health_check_interval = 30.0):
+        self.db_name = db_name
+        self.db_user = db_user
+        self.db_pwd = db_pwd
+        self.host = host
+        self.port = port
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        # Idle connections as (client, time of checkin) pairs
+        self.idle = deque()
+        self.size = 0
+        self.condition = Condition()
+        for _ in range(min_size):
+            self.idle.append((self._connect(), time.time()))
+            self.size += 1
+
+    def _connect(self):
+        """ Returns a new pyorient client connected to the db """
+        client = pyorient.OrientDB(self.host, self.port)
+        client.db_open(self.db_name, self.db_user, self.db_pwd,
+                       pyorient.DB_TYPE_GRAPH)
+        return client
+
+    def connect_unpooled(self):
+        """
+        Returns a new client which is not managed by the pool and does not
+        count against max_size, for holding a connection for a long time
+        (e.g. bulk loads) without starving pooled readers. Close it with
+        close_unpooled().
+
+        """
+        return self._connect()
+
+    def close_unpooled(self, client):
+        """ Closes a client returned by connect_unpooled() """
+        self._close(client)
+
+    def _is_healthy(self, client):
+        try:
+            client.db_reload()
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def checkout(self, timeout = None):
+        """
+        Returns a pyorient client for exclusive use, waiting for at most
+        timeout seconds (defaults to self.timeout) if all connections are in
+        use. Raises a PoolTimeout if none becomes available.
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout("No connection available after %.1fs"
+                                      % timeout)
+                self.condition.wait(remaining)
+
+            if self.idle:
+                (client, since) = self.idle.pop()
+            else:
+                (client, since) = (None, None)
+                self.size += 1
+
+        # Connect and check health outside of the lock
+        try:
+            if client and time.time() - since > self.health_check_interval \
+                    and not self._is_healthy(client):
+                self._close(client)
+                client = None
+            if not client:
+                client = self._connect()
+        except:
+            self._discard()
+            raise
+        return client
+
+    def checkin(self, client, broken = False):
+        """
+        Returns a client to the pool. Broken clients are closed, keeping at
+        least min_size connections is left to subsequent checkouts.
+
+        """
+        if broken:
+            self._close(client)
+            self._discard()
+            return
+        with self.condition:
+            self.idle.append((client, time.time()))
+            self.condition.notify()
+
+    def _discard(self):
+        """ Forgets about a connection, making room for a new one """
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    @staticmethod
+    def _close(client):
+        try:
+            client.db_close()
+        except CONNECTION_ERRORS:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager checking out a client and returning it to the pool
+        afterwards. Connections failing with a connection error are replaced.
+
+        """
+        client = self.checkout()
+        try:
+            yield client
+        except CONNECTION_ERRORS:
+            self.checkin(client, broken = True)
+            raise
+        except:
+            self.checkin(client)
+            raise
+        self.checkin(client)
+
+    def run(self, f, retries = 1):
+        """
+        Calls f with a checked out client and returns its result. If the
+        connection fails, f is retried with a fresh connection, so f should
+        not have side effects beyond the db query.
+
+        """
+        while True:
+            try:
+                with self.connection() as client:
+                    return f(client)
+            except CONNECTION_ERRORS:
+                if retries <= 0:
+                    raise
+                retries -= 1
+
+    def close(self):
+        """ Closes all idle connections """
+        with self.condition:
+            while self.idle:
+                (client, since) = self.idle.pop()
+                self._close(client)
+                self.size -= 1
@@ -0,0 +1,405 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+from array import array
+from collections import defaultdict
+from threading import Lock
+
+from pyorient.otypes import OrientRecord, OrientRecordLink
+
+from ArabicWordGraph import ArabicWordGraph
+from ResultSet import ResultSet
+from SubgraphCache import SubgraphCache
+from WrappedRecord import WrappedRecord, WrappedNode, WrappedEdge
+
+# Schema class names by the lower case names the write methods use
+CLASS_NAMES = dict((c.lower(), c) for c in (
+    "Root", "Verb", "Noun", "Particle", "Collocation", "Text", "ForeignNode",
+    "Edge", "DerivationEdge", "VerbDerivationEdge", "NounDerivationEdge",
+    "InformationEdge"))
+
+NO_DB = "Database access is not supported by MemoryGraph"
+
+class MemoryGraph(ArabicWordGraph):
+    """
+    ArabicWordGraph held in memory, answering the read methods without a
+    database, e.g. to serve /tx and /gw read-only. Returns ResultSets just
+    like ArabicWordGraph.
+
+    Nodes and edges are numbered consecutively and kept as OrientRecords.
+    Adjacency is stored in compressed sparse row format: the ids of the
+    outgoing edges of node i are out_edges[out_offsets[i]:out_offsets[i + 1]],
+    likewise for incoming edges. The fields label and unvocalized_label are
+    indexed by hash maps. Root families, i.e. the nodes connected without
+    passing ForeignNodes (see SQL_GET_NODE_FETCH_SUBGRAPH), are precomputed.
+
+    Load a snapshot with from_orientdb() or import an ElixirFM dump with the
+    Importer, which uses the write methods. Writes rebuild the arrays and
+    indexes on the next read, which is not meant to happen while serving.
+    Limits apply to the number of records, fetchplans are ignored. Methods
+    of ArabicWordGraph which are not overridden and need the database raise
+    a NotImplementedError.
+
+    """
+    NODE_CLUSTER = 1
+    EDGE_CLUSTER = 2
+    INDEXED_FIELDS = ("label", "unvocalized_label")
+
+    def __init__(self, subgraph_cache = None):
+        # Not calling ArabicWordGraph.__init__(), which connects to the db.
+        # Methods needing a connection raise a NotImplementedError instead.
+        self.pool = None
+        self.bulk_loader = None
+        self.root_families = False
+        self.dirty_family_rids = set()
+        self.dirty_family_lock = Lock()
+        self.change_listeners = []
+        if subgraph_cache is None:
+            subgraph_cache = SubgraphCache()
+        self.subgraph_cache = subgraph_cache
+        self.add_change_listener(subgraph_cache.invalidate)
+
+        # Records by node and edge id
+        self.nodes = []
+        self.edges = []
+        # Endpoints by edge id
+        self.edge_out = array("i")
+        self.edge_in = array("i")
+        # rid -> node id, and edge rid -> edge id
+        self.node_ids = {}
+        self.edge_ids = {}
+        self.lock = Lock()
+        self.frozen = False
+
+    def _query(self, query, limit, fetchplan, primary_pred = lambda x: True):
+        raise NotImplementedError(NO_DB)
+
+    def _command(self, command):
+        raise NotImplementedError(NO_DB)
+
+    def _run(self, f):
+        raise NotImplementedError(NO_DB)
+
+    ## ---------------------------------------------------------------------
+    ## Loading
+
+    @staticmethod
+    def from_orientdb(graph = None, subgraph_cache = None):
+        """
+        Returns a MemoryGraph holding a snapshot of the nodes and edges of an
+        ArabicWordGraph (by default a new one), caching subgraphs in the given
+        SubgraphCache (or in a new one).
+
+        """
+        if not graph:
+            graph = ArabicWordGraph()
+        (nodes, edges) = graph.pool.run(lambda client: (
+                client.query("select from Node", -1, "*:0"),
+                client.query("select from E", -1, "*:0")))
+        g = MemoryGraph(subgraph_cache)
+        for r in nodes:
+            # The RidBags are replaced by the adjacency arrays
+            for k in [k for k in r.oRecordData
+                      if WrappedNode._skip_field(k)]:
+                del r.oRecordData[k]
+            g._add_node(r)
+        for r in edges:
+            d = r.oRecordData
+            if all("#" + d[k]._OrientRecordLink__link in g.node_ids
+                   for k in ("in", "out")):
+                g._add_edge(r)
+        g.freeze()
+        return g
+
+    def _add_node(self, r):
+        self.node_ids[r._OrientRecord__rid] = len(self.nodes)
+        self.nodes.append(r)
+        self.frozen = False
+
+    def _add_edge(self, r):
+        d = r.oRecordData
+        self.edge_ids[r._OrientRecord__rid] = len(self.edges)
+        self.edges.append(r)
+        self.edge_out.append(self.node_ids["#" + d["out"]._OrientRecordLink__link])
+        self.edge_in.append(self.node_ids["#" + d["in"]._OrientRecordLink__link])
+        self.frozen = False
+
+    def freeze(self):
+        """
+        Builds adjacency arrays, indexes and families. Called on the first
+        read after writes.
+
+        """
+        with self.lock:
+            if self.frozen:
+                return
+            n = len(self.nodes)
+            (self.out_offsets, self.out_edges) = _csr(n, self.edge_out)
+            (self.in_offsets, self.in_edges) = _csr(n, self.edge_in)
+
+            # Field -> value -> node ids
+            self.indexes = dict((f, defaultdict(list))
+                                for f in self.INDEXED_FIELDS)
+            for (i, r) in enumerate(self.nodes):
+                for (f, index) in self.indexes.iteritems():
+                    v = r.oRecordData.get(f)
+                    if v is not None:
+                        index[_unicode(v)].append(i)
+
+            self._compute_families()
+            self.frozen = True
+
+    def _compute_families(self):
+        """
+        Numbers the root families, family[i] being the family of node i or
+        -1 for ForeignNodes, and collects the edge ids of each family.
+
+        """
+        n = len(self.nodes)
+        self.family = array("i", [-1]) * n
+        self.family_edges = []
+        for start in xrange(n):
+            if self.family[start] >= 0 or self._is_foreign(start):
+                continue
+            f = len(self.family_edges)
+            self.family[start] = f
+            edges = set()
+            stack = [start]
+            while stack:
+                i = stack.pop()
+                for (e, j) in self._adjacent(i):
+                    edges.add(e)
+                    if self.family[j] < 0 and not self._is_foreign(j):
+                        self.family[j] = f
+                        stack.append(j)
+            self.family_edges.append(array("i", sorted(edges)))
+
+    def _is_foreign(self, i):
+        return self.nodes[i]._OrientRecord__o_class == "ForeignNode"
+
+    def _adjacent(self, i):
+        """ Yields (edge id, node id) pairs of the edges of node i """
+        for k in xrange(self.out_offsets[i], self.out_offsets[i + 1]):
+            e = self.out_edges[k]
+            yield (e, self.edge_in[e])
+        for k in xrange(self.in_offsets[i], self.in_offsets[i + 1]):
+            e = self.in_edges[k]
+            yield (e, self.edge_out[e])
+
+    def _result_set(self, node_ids, edge_ids = (), limit = -1,
+                    primary_pred = lambda x: True):
+        """
+        Returns a ResultSet of the given nodes and edges and of the edges'
+        endpoints. At most limit nodes and limit edges are taken.
+        
+        """
+        if limit > 0:
+            node_ids = list(node_ids)[:limit]
+            edge_ids = list(edge_ids)[:limit]
+        node_ids = set(node_ids)
+        for e in edge_ids:
+            node_ids.add(self.edge_out[e])
+            node_ids.add(self.edge_in[e])
+        records = [self.edges[e] for e in edge_ids]
+        records += [self.nodes[i] for i in node_ids]
+        return ResultSet(records, primary_pred)
+
+    def _subgraphs(self, node_ids, limit, primary_pred):
+        """ Returns a ResultSet of the families of the given nodes """
+        if not self.frozen:
+            self.freeze()
+        families = set(self.family[i] for i in node_ids) - set([-1])
+        edge_ids = sorted(set(e for f in families for e in self.family_edges[f]))
+        return self._result_set((), edge_ids, limit, primary_pred)
+
+    ## ---------------------------------------------------------------------
+    ## Reading
+
+    def search_index(self, q, fetch_subgraph = True, index = "Node.label",
+                     limit = ArabicWordGraph.DEFAULT_LIMIT, fetchplan = None,
+                     primary_pred = None):
+        if not self.frozen:
+            self.freeze()
+        field = index.split(".")[-1]
+        if field not in self.indexes:
+            raise ValueError("No index %s" % index)
+        ids = self.indexes[field].get(_unicode(q), [])
+        if index.startswith("ArabicNode."):
+            ids = [i for i in ids if not self._is_foreign(i)]
+
+        if not primary_pred:
+            primary_pred = lambda x: x.data.get(field) == q
+        if fetch_subgraph:
+            return self._subgraphs(ids, limit, primary_pred)
+        return self._result_set(ids, limit = limit, primary_pred = primary_pred)
+
+    def get_nodes(self, rids, fetch_subgraph = True,
+                  limit = ArabicWordGraph.DEFAULT_LIMIT, fetchplan = None):
+        if not self.frozen:
+            self.freeze()
+        primary_pred = lambda x: x.rid in rids
+        if fetch_subgraph and len(rids) == 1 and limit == self.DEFAULT_LIMIT:
+            rs = self.subgraph_cache.get(rids[0])
+            if rs is None:
+                rs = self._subgraphs([self.node_ids[rid] for rid in rids
+                                      if rid in self.node_ids], limit,
+                                     primary_pred)
+                if rids[0] in rs.result_map:
+                    self.subgraph_cache.put(rs)
+            return rs.with_primary_pred(primary_pred)
+
+        node_ids = [self.node_ids[rid] for rid in rids if rid in self.node_ids]
+        if fetch_subgraph:
+            return self._subgraphs(node_ids, limit, primary_pred)
+        # Edges can be fetched like nodes, see get_edges()
+        records = [self.nodes[i] for i in node_ids] + \
+                  [self.edges[self.edge_ids[rid]] for rid in rids
+                   if rid in self.edge_ids]
+        if limit > 0:
+            records = records[:limit]
+        return ResultSet(records, primary_pred)
+
+    def get_topology(self, rids, limit = ArabicWordGraph.DEFAULT_LIMIT):
+        return self.get_nodes(rids, True, limit)
+
+    def get_edges(self, rids):
+        return self.get_nodes(rids, False, -1)
+
+    def get_root_family(self, rid, primary_pred = lambda x: True):
+        return None
+
+    def search_foreign(self, q, limit = ArabicWordGraph.DEFAULT_LIMIT,
+                       fetchplan = None):
+        if not self.frozen:
+            self.freeze()
+        ids = set()
+        for i in self.indexes["label"].get(_unicode(q), []):
+            ids.update(self.edge_out[self.in_edges[k]] for k
+                       in xrange(self.in_offsets[i], self.in_offsets[i + 1]))
+        return self._result_set(ids, limit = limit)
+
+    def get_foreign_nodes(self, source, limit = -1):
+        ids = [i for (i, r) in enumerate(self.nodes) if self._is_foreign(i)
+               and r.oRecordData.get("source") == source]
+        return self._result_set(ids, limit = limit)
+
+    def get_roots(self, limit = -1):
+        ids = [i for (i, r) in enumerate(self.nodes)
+               if r._OrientRecord__o_class == "Root"]
+        return self._result_set(ids, limit = limit)
+
+    ## ---------------------------------------------------------------------
+    ## Writing
+
+    def set_layout(self, rid, positions):
+        r = self.nodes[self.node_ids[rid]]
+        r.oRecordData["layout"] = positions
+        r._OrientRecord__version += 1
+        self.subgraph_cache.invalidate([rid])
+
+    def create_node(self, _class, label, **kwargs):
+        kwargs["label"] = label
+        kwargs.update({"__rid": "#%d:%d" % (self.NODE_CLUSTER, len(self.nodes)),
+                       "__version": 1,
+                       "__o_class": CLASS_NAMES.get(_class.lower(), _class)})
+        r = OrientRecord(kwargs)
+        self._add_node(r)
+        self._changed([r._OrientRecord__rid])
+        return WrappedNode(r)
+
+    def create_edge(self, _class, src, tgt, **kwargs):
+        if isinstance(src, WrappedRecord):
+            src = src.rid
+        if isinstance(tgt, WrappedRecord):
+            tgt = tgt.rid
+        kwargs.update({"__rid": "#%d:%d" % (self.EDGE_CLUSTER, len(self.edges)),
+                       "__version": 1,
+                       "__o_class": CLASS_NAMES.get(_class.lower(), _class),
+                       "out": OrientRecordLink(src[1:]),
+                       "in": OrientRecordLink(tgt[1:])})
+        r = OrientRecord(kwargs)
+        self._add_edge(r)
+        # Like OrientDB, increment the versions of the connected nodes
+        for rid in (src, tgt):
+            self.nodes[self.node_ids[rid]]._OrientRecord__version += 1
+        self._changed([src, tgt])
+        return WrappedEdge(r)
+
+    def begin_bulk_load(self, max_statements = None):
+        return None
+
+    def flush(self):
+        pass
+
+    def end_bulk_load(self):
+        return None
+
+    def update_root_families(self, rids):
+        return []
+
+    def update_dirty_root_families(self):
+        return []
+
+
+def _csr(n, sources):
+    """
+    Returns (offsets, edge ids) of the edges grouped by source node, sources
+    being the source node of each edge.
+
+    """
+    offsets = array("i", [0]) * (n + 1)
+    for i in sources:
+        offsets[i + 1] += 1
+    for i in xrange(n):
+        offsets[i + 1] += offsets[i]
+    edges = array("i", [0]) * len(sources)
+    cursor = array("i", offsets)
+    for (e, i) in enumerate(sources):
+        edges[cursor[i]] = e
+        cursor[i] += 1
+    return (offsets, edges)
+
+def _unicode(s):
+    return s.decode("utf-8") if isinstance(s, str) else s
+
+
+if __name__ == '__main__':
+    import argparse, time, timeit
+
+    parser = argparse.ArgumentParser(
+            description = "Loads the graph into memory and times lookups")
+    parser.add_argument("--dump", default = None,
+                        help = "ElixirFM lexicon dumped as json (default: "
+                               "snapshot of the OrientDB graph)")
+    parser.add_argument("queries", nargs = "*", default = [u"فضل"])
+    args = parser.parse_args()
+
+    t = time.time()
+    if args.dump:
+        from elixirfm.Importer import Importer
+        G = MemoryGraph()
+        Importer(G).import_dump(args.dump)
+        G.freeze()
+    else:
+        G = MemoryGraph.from_orientdb()
+    print "Loaded %d nodes, %d edges in %.1fs" \
+            % (len(G.nodes), len(G.edges), time.time() - t)
+
+    for q in args.queries:
+        q = _unicode(q)
+        hits = G.search_index(q, False, "ArabicNode.unvocalized_label")
+        rids = [n.rid for n in hits.nodes]
+        if not rids:
+            print "No hits for %s" % q.encode("utf-8")
+            continue
+        for (name, f) in (
+                ("search_index", lambda: G.search_index(
+                        q, False, "ArabicNode.unvocalized_label")),
+                ("search_arabic", lambda: G.search_arabic(q)),
+                ("get_nodes", lambda: G.get_nodes(rids[:1]))):
+            n = 1000
+            print "%s %s: %.1f us" % (name, q.encode("utf-8"),
+                                      timeit.timeit(f, number = n) * 1e6 / n)
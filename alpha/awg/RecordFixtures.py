@@ -0,0 +1,47 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import base64, struct
+from pyorient.otypes import OrientRecord, OrientRecordLink, OrientBinaryObject
+
+from RidBag import RidBag
+
+
+def fixture_records(n_roots, n_derived = 20, edges = True):
+    """
+    Returns OrientRecords shaped like the result of a root family query: per
+    root, n_derived nouns, each with an edge from the root. The edge records
+    are left out unless edges is set, as in a query for the topology. Used by
+    tests and benchmarks.
+    
+    """
+    def bag(rids):
+        # Embedded RidBag, see RidBag
+        s = struct.pack("!bi", RidBag.EMBEDDED, len(rids))
+        for rid in rids:
+            s += struct.pack("!hq", *map(int, rid.split(":")))
+        return OrientBinaryObject(base64.b64encode(s))
+
+    records = []
+    for i in range(n_roots):
+        root = "16:%d" % i
+        edge_rids = ["18:%d" % (i * n_derived + j) for j in range(n_derived)]
+        records.append(OrientRecord({"__rid": "#" + root, "__version": 3,
+                "__o_class": "Root", "label": "\xd9\x83 \xd8\xaa \xd8\xa8",
+                "out_HasDerivation": bag(edge_rids)}))
+        for (j, edge) in enumerate(edge_rids):
+            node = "17:%d" % (i * n_derived + j)
+            records.append(OrientRecord({"__rid": "#" + node, "__version": 2,
+                    "__o_class": "Noun", "label": "\xd9\x83\xd9\x90\xd8\xaa\xd9\x8e\xd8\xa7\xd8\xa8",
+                    "unvocalized_label": "\xd9\x83\xd8\xaa\xd8\xa7\xd8\xa8",
+                    "translations": ["book", "letter"],
+                    "in_HasDerivation": bag([edge])}))
+            if edges:
+                records.append(OrientRecord({"__rid": "#" + edge,
+                        "__version": 1, "__o_class": "HasDerivation",
+                        "out": OrientRecordLink(root),
+                        "in": OrientRecordLink(node)}))
+    return records
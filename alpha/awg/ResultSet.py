@@ -4,9 +4,14 @@
 @author: mirko
 '''
 
+import json, logging
 from itertools import ifilter, ifilterfalse
+from pyorient.otypes import OrientRecord, OrientRecordLink
 
-from WrappedRecord import WrappedRecord
+from WrappedRecord import WrappedRecord, WrappedNode, FakeEdge
+from Tracer import Tracer
+
+log = logging.getLogger("shabaka.awg")
 
 class ResultSet(object):
     @staticmethod
@@ -16,11 +21,49 @@ class ResultSet(object):
         Creates a ResultSet by querying an OrientDB client.
         
         """
+        tracer = Tracer.shared()
         results = []
         cb = lambda r: results.append(r)
-        results += orientdb_client.query(query, limit, fetchplan, cb)
-        return ResultSet(results, primary_pred)
+        with tracer.span("db_query"):
+            results += orientdb_client.query(query, limit, fetchplan, cb)
+        with tracer.span("resultset"):
+            return ResultSet(results, primary_pred)
     
+    @staticmethod
+    def from_json(s, primary_pred = lambda x: True):
+        """ Creates a ResultSet from records serialized by to_json() """
+        records = []
+        for m in json.loads(s):
+            for (k, v) in m.iteritems():
+                if isinstance(v, dict) and "@link" in v:
+                    m[k] = OrientRecordLink(v["@link"][1:])
+            m["__rid"] = m.pop("@rid")
+            m["__version"] = m.pop("@version")
+            m["__o_class"] = m.pop("@class")
+            records.append(OrientRecord(m))
+        return ResultSet(records, primary_pred)
+
+    def to_json(self):
+        """
+        Serializes the records, e.g. to store a subgraph as a single document
+        (see ArabicWordGraph.update_root_families()). Links to records are
+        stored as maps {"@link": rid}. RidBags, FakeEdges and edges whose
+        endpoints have not been fetched are left out.
+        
+        """
+        records = []
+        for r in self.all_results:
+            if r.is_edge and (isinstance(r, FakeEdge) or not r.in_ or not r.out):
+                continue
+            m = dict((k, {"@link": v.rid} if isinstance(v, WrappedRecord) else v)
+                     for (k, v) in r.data.iteritems() if v is not None)
+            if r.is_edge:
+                m["in"] = {"@link": r.in_.rid}
+                m["out"] = {"@link": r.out.rid}
+            m.update({"@rid": r.rid, "@version": r.version, "@class": r.cls})
+            records.append(m)
+        return json.dumps(records, separators = (",", ":"))
+
     def __init__(self, results, primary_pred = lambda x: True):
         """
         Creates a ResultSet from OrientRecords, differentiating between primary
@@ -28,22 +71,74 @@ class ResultSet(object):
         when a query retrieves subtrees for search results.
         
         For each OrientRecord, either a WrappedEdge or a WrappedNode object is
-        created. Then links are updated, see WrappedEdge.update_endpoints().
+        created. Then the edges are connected to their endpoints, see
+        WrappedEdge.update_endpoints(). Other fields are decoded on first
+        access only.
          
         """
         self.primary_pred = primary_pred
         self.result_map = {}
         self.index_results_rids = set()
+        edges = []
         for r in results:
             try:
-                wr = WrappedRecord.from_record(r)
-                self.result_map[r._OrientRecord__rid] = wr
+                wr = WrappedRecord.from_record(r, self.result_map)
             except:
-                print "Error parsing record %r" % r
+                log.warning("Error parsing record %r", r)
+                continue
+            self.result_map[wr.rid] = wr
+            if wr.is_edge:
+                edges.append(wr)
 
-        for r in self.result_map.itervalues():
-            r.update_links(self.result_map)
+        for e in edges:
+            e.update_endpoints()
     
+    def add_edges_from_ridbags(self):
+        """
+        Connects the nodes by the edges listed in their RidBags which have not
+        been fetched, so that the topology of a subgraph can be fetched without
+        the edge records. These edges are added as FakeEdges without data,
+        their class is taken from the RidBag field (see WrappedNode.ridbags).
+        
+        Returns False if edges may be missing because a RidBag is stored as
+        tree, otherwise True.
+        
+        """
+        # Edge rid -> [class, out node, in node]
+        ends = {}
+        complete = True
+        for n in list(self.nodes):
+            if not isinstance(n, WrappedNode):
+                continue
+            for (field, bag) in n.ridbags.iteritems():
+                if bag.rids is None:
+                    complete = False
+                    continue
+                (direction, cls) = field.split("_", 1)
+                for rid in bag.rids:
+                    if rid not in self.result_map:
+                        e = ends.setdefault(rid, [cls, None, None])
+                        e[1 if direction == "out" else 2] = n
+
+        for (rid, (cls, out, in_)) in ends.iteritems():
+            if out and in_:
+                e = FakeEdge(out, in_, rid, cls)
+                out.outE.append(e)
+                in_.inE.append(e)
+                self.result_map[rid] = e
+        return complete
+
+    def with_primary_pred(self, primary_pred):
+        """
+        Returns a ResultSet sharing the results of this one, differentiating
+        between primary and secondary results with the given predicate.
+        
+        """
+        rs = ResultSet([], primary_pred)
+        rs.result_map = self.result_map
+        rs.index_results_rids = self.index_results_rids
+        return rs
+
     @property
     def first_result(self):
         """
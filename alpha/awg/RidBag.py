@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+from struct import calcsize, error, unpack_from
+
+class RidBagError(RuntimeError):
+    """ Raised if a serialized RidBag cannot be decoded """
+    pass
+
+
+class RidBag(object):
+    """
+    Decoded OrientDB RidBag, i.e. the in_* and out_* fields of vertices
+    holding the rids of adjacent edges. pyorient passes them as
+    OrientBinaryObjects, which are decoded by from_binary_object().
+
+    Small bags are embedded in the record and list all rids. Larger bags
+    (by default more than 40 rids) are stored in a separate tree. The record
+    then only holds a pointer to the tree and the changes not yet written to
+    it, so their rids are unknown (None) and have to be obtained by
+    fetching the edges.
+
+    Serialization (all numbers big-endian, rids as cluster id (short) and
+    cluster position (long)):
+        config (byte: 1 = embedded, 2 = uuid follows) [uuid (2 longs)]
+        embedded: size (int) rids
+        tree: file id (long) page index (long) page offset (int) size (int)
+              number of changes (int) changes (rid, type (byte), value (int))
+
+    """
+    EMBEDDED = 1
+    HAS_UUID = 2
+
+    __slots__ = ("is_embedded", "rids", "pointer", "changes")
+
+    def __init__(self, is_embedded, rids = None, pointer = None, changes = ()):
+        self.is_embedded = is_embedded
+        # Rid strings of the edges, None for tree bags
+        self.rids = rids
+        # (file id, page index, page offset) of tree bags
+        self.pointer = pointer
+        # Pending changes (rid, type, value) of tree bags
+        self.changes = changes
+
+    @staticmethod
+    def from_binary_object(o):
+        """ Decodes the RidBag given as pyorient OrientBinaryObject """
+        return RidBag.from_bytes(o.getBin())
+
+    @staticmethod
+    def from_bytes(data):
+        """ Decodes the RidBag serialized in data (str) """
+        try:
+            (config,) = unpack_from("!b", data)
+            offset = 1
+            if config & RidBag.HAS_UUID:
+                offset += 16
+            if config & RidBag.EMBEDDED:
+                (size,) = unpack_from("!i", data, offset)
+                return RidBag(True, _unpack_rids(data, offset + 4, size))
+
+            pointer = unpack_from("!qqi", data, offset)
+            offset += calcsize("!qqii")
+            (n_changes,) = unpack_from("!i", data, offset)
+            offset += 4
+            changes = []
+            for _ in xrange(n_changes):
+                (cluster, position, type_, value) = \
+                        unpack_from("!hqbi", data, offset)
+                changes.append(("#%d:%d" % (cluster, position), type_, value))
+                offset += calcsize("!hqbi")
+            return RidBag(False, pointer = pointer, changes = changes)
+        except error as e:
+            raise RidBagError("Cannot decode RidBag: %s" % e)
+
+    def __repr__(self):
+        if self.is_embedded:
+            return "RidBag(%r)" % self.rids
+        return "RidBag(tree %r, %d changes)" % (self.pointer, len(self.changes))
+
+
+def _unpack_rids(data, offset, n):
+    # Cluster ids and positions alternate, see RidBag
+    numbers = unpack_from("!" + "hq" * n, data, offset)
+    return ["#%d:%d" % (numbers[i], numbers[i + 1])
+            for i in xrange(0, len(numbers), 2)]
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import json, re
+
+RID_PATTERN = re.compile(r"^#-?\d+:-?\d+$")
+
+class Statement(object):
+    """
+    SQL statement template with positional placeholders, which are replaced by
+    escaped literals on the client. To be used instead of interpolating user
+    input into SQL strings with "%".
+
+    The placeholder "?" is replaced by a literal: strings are quoted and escaped, maps
+    are encoded as JSON, lists and tuples become collections. The placeholder
+    "#?" is replaced by a rid or a list of rids, which are validated and inserted
+    unquoted (as OrientDB does not accept quoted rids as query targets).
+
+    These are neither prepared statements nor server-side parameters:
+    pyorient always sends an empty parameter map with a command, so the
+    server receives plain SQL text with literals. OrientDB
+    thus parses every distinct query anew, as before. Statements are parsed
+    once on the client and cached, use Statement.get() to obtain them; the
+    benchmark in __main__ compares binding with "%" interpolation.
+
+    """
+    _cache = {}
+
+    @staticmethod
+    def get(sql):
+        """ Returns the cached Statement for the given sql """
+        s = Statement._cache.get(sql)
+        if not s:
+            s = Statement._cache[sql] = Statement(sql)
+        return s
+
+    def __init__(self, sql):
+        self.sql = sql
+        tokens = re.split(r"(#\?|\?)", sql)
+        self.parts = tokens[0::2]
+        self.placeholders = tokens[1::2]
+
+    def bind(self, *params):
+        """
+        Returns the SQL text with the placeholders replaced by the literals of
+        the given values. Raises a ValueError if the number of values does
+        not match or if a rid is malformed.
+
+        """
+        if len(params) != len(self.placeholders):
+            raise ValueError("Statement takes %d values, %d given"
+                             % (len(self.placeholders), len(params)))
+        s = [self.parts[0]]
+        for (placeholder, param, part) in zip(self.placeholders, params,
+                                              self.parts[1:]):
+            if placeholder == "#?":
+                s.append(rid_literal(param))
+            else:
+                s.append(literal(param))
+            s.append(part)
+        return "".join(s)
+
+    def __len__(self):
+        return len(self.placeholders)
+
+
+def literal(v):
+    """ Returns the OrientDB SQL literal for given value """
+    if v is None:
+        return "null"
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (int, long, float)):
+        return repr(v)
+    if isinstance(v, str):
+        v = v.decode("utf-8")
+    if isinstance(v, unicode):
+        return "'%s'" % v.replace("\\", "\\\\").replace("'", "\\'")
+    if isinstance(v, dict):
+        return json.dumps(v)
+    if isinstance(v, (list, tuple)):
+        return "[%s]" % ", ".join(literal(x) for x in v)
+    raise ValueError("Cannot bind %r" % v)
+
+def rid_literal(v):
+    """ Returns given rid or list of rids, raising a ValueError if malformed """
+    if isinstance(v, (list, tuple)):
+        return "[%s]" % ", ".join(rid_literal(x) for x in v)
+    if not isinstance(v, basestring) or not RID_PATTERN.match(v):
+        raise ValueError("Not a rid: %r" % (v, ))
+    return str(v)
+
+
+if __name__ == '__main__':
+    import timeit
+
+    # Benchmark: client-side cost of binding vs. "%" interpolation, which
+    # neither escapes nor validates
+    sql = "SELECT EXPAND(rid) FROM index:Node.label where key = ?"
+    before = lambda: "SELECT EXPAND(rid) FROM index:Node.label where key = '%s'" % u"kataba"
+    after = lambda: Statement.get(sql).bind(u"kataba")
+    for (name, f) in (("before", before), ("after", after)):
+        t = min(timeit.repeat(f, number = 100000, repeat = 3)) / 100000
+        print "%s: %.2f us/statement" % (name, t * 1e6)
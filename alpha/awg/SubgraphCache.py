@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import time
+from collections import OrderedDict
+from itertools import count
+from threading import Lock
+
+class SubgraphCache(object):
+    """
+    LRU cache of subgraphs as returned by ArabicWordGraph.get_nodes(), i.e. of
+    the graphs of root families. Every node of a cached subgraph maps to the
+    same ResultSet, which must not be modified.
+
+    At most max_records records (nodes and edges) are kept. ArabicWordGraph
+    invalidates subgraphs containing nodes it changes; as other processes may
+    write to the db, too, subgraphs expire after max_age seconds.
+
+    """
+    def __init__(self, max_records = 100000, max_age = 600):
+        self.max_records = max_records
+        self.max_age = max_age
+        # Subgraph id -> (ResultSet, time added)
+        self.subgraphs = OrderedDict()
+        # Node rid -> subgraph id
+        self.subgraph_of = {}
+        self.n_records = 0
+        self.ids = count()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, rid):
+        """ Returns the cached subgraph containing rid or None """
+        with self.lock:
+            i = self.subgraph_of.get(rid)
+            entry = self.subgraphs.pop(i, None)
+            if entry and time.time() - entry[1] > self.max_age:
+                self._drop(i, entry)
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            # Re-insert as most recently used
+            self.subgraphs[i] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, rs):
+        """ Adds the subgraph given as ResultSet """
+        if len(rs) > self.max_records:
+            return
+        with self.lock:
+            i = next(self.ids)
+            self.subgraphs[i] = (rs, time.time())
+            for n in rs.nodes:
+                if n.cls != "ForeignNode":
+                    self.subgraph_of[n.rid] = i
+            self.n_records += len(rs)
+            while self.n_records > self.max_records:
+                (j, entry) = self.subgraphs.popitem(last = False)
+                self._drop(j, entry)
+
+    def invalidate(self, rids):
+        """ Removes the subgraphs containing any of the given nodes """
+        with self.lock:
+            for rid in rids:
+                i = self.subgraph_of.get(rid)
+                entry = self.subgraphs.pop(i, None)
+                if entry:
+                    self._drop(i, entry)
+                    self.invalidations += 1
+
+    def _drop(self, i, entry):
+        """ Forgets about a subgraph removed from self.subgraphs """
+        for rid in entry[0].result_map:
+            if self.subgraph_of.get(rid) == i:
+                del self.subgraph_of[rid]
+        self.n_records -= len(entry[0])
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of counters """
+        return {"subgraphs": len(self.subgraphs), "records": self.n_records,
+                "hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations}
@@ -3,22 +3,22 @@
 '''
 @author: mirko
 '''
-from io import BytesIO
-from struct import unpack
 from pyarabic import araby
+from RidBag import RidBag
 
-def recursive_map(m, f, pred):
+def recursive_map(m, f, pred, skip = None):
     """
     Recursively encodes unicode string in keys and values of given map thus
-    creating a new map and returns it.
+    creating a new map and returns it. Keys satisfying skip are left out.
     
     """
     n = {}
     for (k, v) in m.iteritems():
+        if skip and skip(k): continue
         if pred(k): k = f(k)
         if pred(v): v = f(v)
         elif type(v) == list:
-            v = [f(x) for x in v if pred(x)]
+            v = [f(x) if pred(x) else x for x in v]
         if type(v) == map:
             v = recursive_map(v)
         n[k] = v
@@ -29,14 +29,18 @@ def encode_map(m):
     """  Recursively encodes unicode string in keys and values """
     return recursive_map(m, lambda x: x.encode("utf-8"), lambda x: type(x) == unicode)
 
-def decode_map(m):
+def decode_map(m, skip = None):
     """  Recursively decodes utf-8 encoded string in keys and values """
-    return recursive_map(m, lambda x: x.decode("utf-8"), lambda x: type(x) == str)
+    return recursive_map(m, lambda x: x.decode("utf-8"), lambda x: type(x) == str,
+                         skip)
 
 def rid_data_to_rids(data):
-    stream = BytesIO(data)
-    (a,l) = unpack("!bi", stream.read(5))
-    return ["#%d:%d" % unpack("!hq", stream.read(10))]
+    """
+    Returns the rids in a serialized RidBag or None if they are stored in a
+    tree, see RidBag.
+    
+    """
+    return RidBag.from_bytes(data).rids
 
 def is_vocalized_like(w1, w2, ignore_shaddas = False):
     """
@@ -74,6 +78,10 @@ def is_vocalized_like(w1, w2, ignore_shaddas = False):
             
     return True 
 
+def strip_vocalization(w):
+    """ Returns an arabic unicode string without tashkeel """
+    return araby.strip_tashkeel(w)
+
 def stem_to_int(s):
     return {"I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "VI": 6,
         "VII": 7, "VIII": 8, "IX": 9, "X": 10}.get(s)
@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import functools, json, logging, time
+from collections import defaultdict
+from threading import Lock, local
+
+log = logging.getLogger("shabaka.trace")
+
+class Tracer(object):
+    """
+    Measures the time spent in named spans, e.g. db queries or layouts.
+
+    Tracing is switched by level: OFF does nothing at all, METRICS
+    aggregates count, total and maximum duration per span name in memory
+    (see stats), LOG additionally logs every request with its spans as a
+    json line to the logger "shabaka.trace".
+
+        with Tracer.shared().request("gw/show"):
+            with Tracer.shared().span("layout"):
+                ...
+
+    """
+    OFF = 0
+    METRICS = 1
+    LOG = 2
+
+    _shared = None
+
+    @staticmethod
+    def shared():
+        """ Returns the tracer used throughout the application """
+        if not Tracer._shared:
+            Tracer._shared = Tracer()
+        return Tracer._shared
+
+    def __init__(self, level = OFF):
+        self.level = level
+        self.lock = Lock()
+        # Span name -> [count, total seconds, max seconds]
+        self.metrics = defaultdict(lambda: [0, 0.0, 0.0])
+        # Spans of the current request of each thread
+        self.local = local()
+
+    def span(self, name):
+        """ Returns a context manager measuring a span of given name """
+        if not self.level:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def request(self, name):
+        """
+        Returns a context manager measuring a request, collecting the spans
+        measured by the same thread meanwhile.
+
+        """
+        if not self.level:
+            return _NULL_SPAN
+        return _Request(self, name)
+
+    def _record(self, name, seconds):
+        with self.lock:
+            m = self.metrics[name]
+            m[0] += 1
+            m[1] += seconds
+            m[2] = max(m[2], seconds)
+        spans = getattr(self.local, "spans", None)
+        if spans is not None:
+            spans.append((name, seconds))
+
+    @property
+    def stats(self):
+        """ Returns a dictionary: span name -> counters in ms """
+        with self.lock:
+            return dict((name, {"n": n, "total_ms": total * 1000,
+                                "mean_ms": total * 1000 / n,
+                                "max_ms": max_ * 1000})
+                        for (name, (n, total, max_)) in self.metrics.iteritems())
+
+
+def traced_request(name):
+    """ Decorator measuring calls of a function as request of given name """
+    def decorate(f):
+        @functools.wraps(f)
+        def traced(*args, **kwargs):
+            with Tracer.shared().request(name):
+                return f(*args, **kwargs)
+        return traced
+    return decorate
+
+
+class _Span(object):
+    __slots__ = ("tracer", "name", "t")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.t = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer._record(self.name, time.time() - self.t)
+
+
+class _Request(_Span):
+    __slots__ = ()
+
+    def __enter__(self):
+        self.tracer.local.spans = []
+        return _Span.__enter__(self)
+
+    def __exit__(self, *exc_info):
+        seconds = time.time() - self.t
+        spans = self.tracer.local.spans
+        self.tracer.local.spans = None
+        self.tracer._record(self.name, seconds)
+        if self.tracer.level >= Tracer.LOG:
+            log.info(json.dumps({"request": self.name, "ms": seconds * 1000,
+                                 "spans": [(n, s * 1000) for (n, s) in spans]}))
+
+
+class _NullSpan(object):
+    """ Span doing nothing, used if tracing is off """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NULL_SPAN = _NullSpan()
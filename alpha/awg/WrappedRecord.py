@@ -7,42 +7,81 @@
 from itertools import chain
 from pyorient.otypes import OrientRecordLink
 
+from RidBag import RidBag
 import Tools
 
 class WrappedRecord(object):
     """
     Wrapper for pyoreint.otypes.OrientRecord for unicode handling and ease of
     access.
+    
+    The record's fields are decoded on first access of data. Links to other
+    records are replaced by the respective wrapped objects found in the map
+    passed to from_record(), or by None.
      
     """
-    def __init__(self, record):
+    __slots__ = ("rid", "cls", "version", "_record", "_links", "_data")
+
+    def __init__(self, record, links = None):
         """  """
         self.rid = record._OrientRecord__rid
         self.cls = record._OrientRecord__o_class
         self.version = record._OrientRecord__version
-        self.data = Tools.decode_map(record.oRecordData)
+        # Decoded and dropped on first access of data
+        self._record = record
+        self._links = links
+        self._data = None
 
     @staticmethod
-    def from_record(r):
-        try:
-            if isinstance(r.oRecordData['in'], OrientRecordLink) and \
-                    isinstance(r.oRecordData['out'], OrientRecordLink):
-                return WrappedEdge(r)
-            else:
-                return WrappedNode(r)
-        except:
-            return WrappedNode(r)
-        
-    def update_links(self, map):
+    def from_record(r, links = None):
         """
-        Replaces OrientRecordLinks with their respective wrapped object. If the
-        rid cannot be found in the given map, replaces the link with None.
+        Returns a WrappedEdge if r links two records as "in" and "out",
+        otherwise a WrappedNode. links maps rids to wrapped records, see
+        WrappedRecord.
         
         """
-        for (k, v) in self.data.iteritems():
+        d = r.oRecordData
+        if isinstance(d.get("in"), OrientRecordLink) and \
+                isinstance(d.get("out"), OrientRecordLink):
+            return WrappedEdge(r, links)
+        return WrappedNode(r, links)
+
+    @property
+    def data(self):
+        """ Returns the record's fields as map with unicode strings """
+        if self._data is None:
+            # Cached result sets are shared between threads: _data is set
+            # before _record is dropped, so a concurrent call either decodes
+            # again or finds _data.
+            record = self._record
+            if record is not None:
+                self._data = self._decode(record.oRecordData)
+                self._record = None
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._record = None
+
+    def _decode(self, m):
+        d = Tools.decode_map(m, self._skip_field)
+        for (k, v) in d.iteritems():
             if isinstance(v, OrientRecordLink):
-                self.data[k] =  map.get("#" + v._OrientRecordLink__link)
-    
+                d[k] = self._resolve(v)
+        return d
+
+    def _resolve(self, link):
+        """ Returns the wrapped record for an OrientRecordLink or None """
+        if self._links is None:
+            return None
+        return self._links.get("#" + link._OrientRecordLink__link)
+
+    @staticmethod
+    def _skip_field(k):
+        """ Returns whether field k is not to be included in data """
+        return False
+
     def __equal__(self, r):
         return self.rid == r.rid
 
@@ -61,30 +100,85 @@ class WrappedRecord(object):
         return self.rid == "#-1:-1"
 
 class WrappedNode(WrappedRecord):
-    def __init__(self, record):
+    """
+    Node with adjacent edges inE and outE.
+    
+    inE and outE hold the fetched edges, see WrappedEdge.update_endpoints().
+    The RidBags listing the rids of all adjacent edges are left out of data
+    and decoded on demand, see ridbags and edge_rids().
+    
+    """
+    __slots__ = ("inE", "outE", "_bags")
+
+    def __init__(self, record, links = None):
+        super(WrappedNode, self).__init__(record, links)
+        self.inE = []
+        self.outE = []
+        # Field -> RidBag, or the raw field value until decoded
+        self._bags = None
+
+    @staticmethod
+    def _skip_field(k):
+        return k.startswith("in_") or k.startswith("out_")
+
+    def _decode(self, m):
+        if self._bags is None:
+            self._bags = self._raw_bags(m)
+        return super(WrappedNode, self)._decode(m)
+
+    def _raw_bags(self, m):
+        return dict((k, v) for (k, v) in m.iteritems() if self._skip_field(k))
+
+    @property
+    def ridbags(self):
         """
-        Creates a WrappedNode from an OrientRecord, adding the properties
-        "in" and "out".
+        Returns a map from RidBag fields (e.g. "out_HasDerivation") to
+        RidBags. Links fetched as lists are returned as embedded RidBags.
         
-        As pyorient does not parse RidBags, the information about incoming and
-        outgoing edges is represented by useless OrientBinaryObjects objects.
-        We have to reconstruct it from the edges' endpoints, see
-        WrappedEdge.update_endpoints().
+        """
+        if self._bags is None:
+            # Do not decode data just for the RidBags
+            record = self._record
+            if record is not None:
+                self._bags = self._raw_bags(record.oRecordData)
+            else:
+                self.data
+        for (k, v) in self._bags.iteritems():
+            if isinstance(v, RidBag):
+                continue
+            if isinstance(v, list):
+                v = RidBag(True, ["#" + l._OrientRecordLink__link for l in v
+                                  if isinstance(l, OrientRecordLink)])
+            elif isinstance(v, OrientRecordLink):
+                v = RidBag(True, ["#" + v._OrientRecordLink__link])
+            else:
+                v = RidBag.from_binary_object(v)
+            self._bags[k] = v
+        return self._bags
+
+    def edge_rids(self, direction = "both", edge_class = None):
+        """
+        Returns the rids of all adjacent edges, whether fetched or not, in
+        given direction ("in", "out" or "both"), optionally only those of
+        given edge class. Returns None if some of them are unknown as their
+        RidBag is stored as tree.
         
         """
-        super(WrappedNode, self).__init__(record)
-        # Delete useless OrientBinaryObjects
-        for k in self.data.keys():
-            if k.startswith("in_") or k.startswith("out_"):
-                self.data.pop(k)
-                
-        self.data["in"] = []
-        self.data["out"] = []
+        rids = []
+        for (k, bag) in self.ridbags.iteritems():
+            (d, cls) = k.split("_", 1)
+            if direction != "both" and d != direction or \
+                    edge_class and cls != edge_class:
+                continue
+            if bag.rids is None:
+                return None
+            rids += bag.rids
+        return rids
         
     def __unicode__(self):
         d = dict(self.data.iteritems())
-        in_edges = ", ".join(n.rid for n in d.pop("in"))
-        out_edges = ", ".join(n.rid for n in d.pop("out"))
+        in_edges = ", ".join(n.rid for n in self.inE)
+        out_edges = ", ".join(n.rid for n in self.outE)
         label = d.pop("label") if "label" in self.data else ""
         return "%s (%s, %s): <-- %s, --> %s, %s" \
                 % (self.rid, self.cls, label, in_edges, out_edges, d)
@@ -113,16 +207,6 @@ class WrappedNode(WrappedRecord):
         """Returns adjacent nodes (as iterator)"""
         return chain(self.in_, self.out)
 
-    @property
-    def inE(self):
-        """Returns adjacent incoming edges"""
-        return self.data["in"]
-    
-    @property
-    def outE(self):
-        """Returns adjacent outgoing edges"""
-        return self.data["out"]
-
     @property
     def bothE(self):
         """Returns adjacent edges"""
@@ -137,41 +221,45 @@ class WrappedNode(WrappedRecord):
 
 
 class WrappedEdge(WrappedRecord):
-    def update_links(self, map):
+    """ Edge with adjacent nodes in_ and out (None if not fetched) """
+    __slots__ = ("in_", "out", "_in_link", "_out_link")
+
+    def __init__(self, record, links = None):
+        super(WrappedEdge, self).__init__(record, links)
+        self.in_ = None
+        self.out = None
+        # Kept apart from data, which leaves them out and may be decoded
+        # before update_endpoints() is called
+        d = record.oRecordData
+        self._in_link = d.get("in")
+        self._out_link = d.get("out")
+
+    def update_endpoints(self):
         """
-        Replaces OrientRecordLinks with their respective wrapped object. If the
-        rid cannot be found in the given map, replaces the link with None.
+        Sets in_ and out to the wrapped nodes the edge links, updating these
+        nodes to refer to this WrappedEdge object, too. (See WrappedNode)
         
-        Updates the connected WrapperNodes to refer to this WrappedEdge object, too.
-        (See WrappedNode.__init__)
-
         """
-        super(WrappedEdge, self).update_links(map)
+        self.in_ = self._resolve(self._in_link)
+        self.out = self._resolve(self._out_link)
         if self.in_:
             self.in_.inE.append(self)
         if self.out:
             self.out.outE.append(self)
 
+    @staticmethod
+    def _skip_field(k):
+        return k == "in" or k == "out"
+
     def __unicode__(self):
-        d = dict(self.data.iteritems())
-        in_ = d.pop("in").rid if self.in_ else None
-        out = d.pop("out").rid if self.out else None
+        in_ = self.in_.rid if self.in_ else None
+        out = self.out.rid if self.out else None
         return "%s (%s): %s --> %s, %s" \
-                % (self.rid, self.cls, in_, out, Tools.encode_map(d))
+                % (self.rid, self.cls, in_, out, Tools.encode_map(self.data))
 
     @property
     def is_edge(self):
         return True
-        
-    @property
-    def in_(self):
-        """Returns adjacent incoming node"""
-        return self.data["in"]
-
-    @property
-    def out(self):
-        """Returns adjacent outgoing node"""
-        return self.data["out"]
 
 
 #######################################################################################
@@ -198,4 +286,33 @@ class FakeNode(FakeRecord):
     def is_edge(self): return False
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    import resource, sys, time
+    from ResultSet import ResultSet
+    from RecordFixtures import fixture_records
+
+    # Benchmark: cost of wrapping fixture records per record, with and
+    # without decoding the fields of every record
+    n_roots = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    records = fixture_records(n_roots)
+    for decode in (False, True):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t = time.time()
+        rs = ResultSet(records)
+        if decode:
+            for r in rs.all_results:
+                r.data
+        t = time.time() - t
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        print "%d records%s: %.2f us/record, %d KB max RSS growth" \
+                % (len(records), " (decoded)" if decode else "",
+                   t * 1e6 / len(records), rss)
+        del rs
+
+    # The same subgraphs without edge records, connected by their RidBags
+    records = fixture_records(n_roots, edges = False)
+    t = time.time()
+    rs = ResultSet(records)
+    rs.add_edges_from_ridbags()
+    t = time.time() - t
+    print "%d records (topology from RidBags): %.2f us/record, %d edges" \
+            % (len(records), t * 1e6 / len(records), len(list(rs.edges)))
\ No newline at end of file
@@ -1 +1,5 @@
-from ArabicWordGraph import ArabicWordGraph
\ No newline at end of file
+from ArabicWordGraph import ArabicWordGraph
+from ConnectionPool import ConnectionPool
+from MemoryGraph import MemoryGraph
+from SubgraphCache import SubgraphCache
+from Tracer import Tracer, traced_request
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import unittest
+from BulkLoader import BulkLoader
+
+
+class FakeRecord(object):
+    def __init__(self, rid):
+        self._OrientRecord__rid = rid
+
+class FakeClient(object):
+    """ Records batch scripts, returns one record per created node """
+    def __init__(self):
+        self.scripts = []
+
+    def batch(self, script):
+        self.scripts.append(script)
+        n = script.count("CREATE VERTEX")
+        return [FakeRecord("#9:%d" % i) for i in range(n)]
+
+
+class BulkLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeClient()
+        self.loader = BulkLoader(self.client, max_statements = None)
+
+    def test_flush_resolves_rids(self):
+        n = self.loader.create_node("WordNode", label = u"كتب")
+        self.loader.create_edge("informationedge", n.rid, "#12:3")
+        self.loader.flush()
+        self.assertEqual(n.rid, "#9:0")
+        self.assertEqual(len(self.client.scripts), 1)
+        self.assertEqual(self.loader.rows, 2)
+
+    def test_rollback(self):
+        self.loader.create_node("WordNode", label = u"a")
+        savepoint = self.loader.savepoint()
+        n = self.loader.create_node("WordNode", label = u"b")
+        self.loader.create_edge("informationedge", n.rid, "#12:3")
+        self.loader.rollback(savepoint)
+        self.assertEqual(len(self.loader), 1)
+        self.assertEqual(len(self.loader.pending_nodes), 1)
+        self.assertEqual(self.loader.pending_endpoints, set())
+        self.loader.flush()
+        self.assertNotIn("#12:3", self.client.scripts[0])
+
+    def test_rollback_after_flush(self):
+        savepoint = self.loader.savepoint()
+        self.loader.create_node("WordNode", label = u"a")
+        self.loader.flush()
+        self.assertRaises(RuntimeError, self.loader.rollback, savepoint)
+
+
+if __name__ == "__main__":
+    unittest.main()
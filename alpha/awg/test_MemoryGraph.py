@@ -0,0 +1,43 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import unittest
+from MemoryGraph import MemoryGraph
+
+
+class MemoryGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.g = MemoryGraph()
+        self.root = self.g.create_node("root", u"ك ت ب")
+        for label in (u"كِتَاب", u"كَاتِب", u"مَكْتَب"):
+            n = self.g.create_node("noun", label)
+            self.g.create_edge("nounderivationedge", self.root, n)
+
+    def test_get_nodes(self):
+        rs = self.g.get_nodes([self.root.rid])
+        self.assertEqual(len(list(rs.nodes)), 4)
+        self.assertEqual([n.rid for n in rs.primary_results], [self.root.rid])
+        self.assertIs(self.g.subgraph_cache.get(self.root.rid).result_map,
+                      rs.result_map)
+
+    def test_get_nodes_limit_bypasses_cache(self):
+        self.g.get_nodes([self.root.rid])
+        rs = self.g.get_nodes([self.root.rid], limit = 1)
+        self.assertEqual(len(list(rs.edges)), 1)
+
+    def test_search_index(self):
+        rs = self.g.search_index(u"كِتَاب", fetch_subgraph = False)
+        self.assertEqual([n.data["label"] for n in rs.primary_results],
+                         [u"كِتَاب"])
+
+    def test_database_access_not_supported(self):
+        self.assertRaises(NotImplementedError, self.g._run, lambda c: None)
+        self.assertRaises(NotImplementedError, self.g._query, "select", -1,
+                          "*:0")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import json, unittest
+
+from ResultSet import ResultSet
+from RecordFixtures import fixture_records
+
+
+def summary(rs):
+    """ Returns the records of rs as comparable maps """
+    m = {}
+    for r in rs.all_results:
+        d = dict(r.data, cls = r.cls, version = r.version)
+        if r.is_edge:
+            d.update({"in": r.in_.rid, "out": r.out.rid})
+        else:
+            d.update({"inE": sorted(e.rid for e in r.inE),
+                      "outE": sorted(e.rid for e in r.outE)})
+        m[r.rid] = d
+    return m
+
+
+class ResultSetTest(unittest.TestCase):
+    def test_from_records(self):
+        rs = ResultSet(fixture_records(2, n_derived = 3))
+        self.assertEqual(len(list(rs.nodes)), 8)
+        self.assertEqual(len(list(rs.edges)), 6)
+        root = rs.result_map["#16:0"]
+        self.assertEqual(sorted(n.rid for n in root.out),
+                         ["#17:0", "#17:1", "#17:2"])
+
+    def test_json_round_trip(self):
+        rs = ResultSet(fixture_records(2, n_derived = 3))
+        s = rs.to_json()
+        restored = ResultSet.from_json(s)
+        self.assertEqual(summary(restored), summary(rs))
+        self.assertEqual(restored.to_json(), s)
+
+    def test_to_json_skips_edges_without_endpoints(self):
+        # Edges whose root has not been fetched
+        records = [r for r in fixture_records(1, n_derived = 2)
+                   if r._OrientRecord__rid != "#16:0"]
+        rs = ResultSet(records)
+        self.assertEqual(sorted(m["@rid"] for m in json.loads(rs.to_json())),
+                         ["#17:0", "#17:1"])
+
+    def test_with_primary_pred(self):
+        rs = ResultSet(fixture_records(1, n_derived = 2))
+        roots = rs.with_primary_pred(lambda r: r.cls == "Root")
+        self.assertEqual([r.rid for r in roots.primary_results], ["#16:0"])
+        self.assertIs(roots.result_map, rs.result_map)
+
+
+if __name__ == "__main__":
+    unittest.main()
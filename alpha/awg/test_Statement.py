@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import unittest
+from Statement import Statement, literal, rid_literal
+
+
+class StatementTest(unittest.TestCase):
+    def test_bind(self):
+        s = Statement("select from ? where label = ? and @rid in #?")
+        self.assertEqual(len(s), 3)
+        self.assertEqual(s.bind(u"Node", u"كتب", ["#12:3", "#13:-1"]),
+                         u"select from 'Node' where label = 'كتب' "
+                         u"and @rid in [#12:3, #13:-1]")
+
+    def test_bind_count(self):
+        s = Statement("select from V where label = ?")
+        self.assertRaises(ValueError, s.bind)
+        self.assertRaises(ValueError, s.bind, u"a", u"b")
+
+    def test_get_caches(self):
+        sql = "select from V where label = ?"
+        self.assertIs(Statement.get(sql), Statement.get(sql))
+
+    def test_escaping(self):
+        self.assertEqual(literal(u"it's"), u"'it\\'s'")
+        self.assertEqual(literal(u"a\\' or 1=1 --"), u"'a\\\\\\' or 1=1 --'")
+        self.assertEqual(literal("\xd9\x83"), u"'ك'")
+        s = Statement.get("select from V where label = ?")
+        self.assertEqual(s.bind(u"x' or '1'='1"),
+                         u"select from V where label = 'x\\' or \\'1\\'=\\'1'")
+
+    def test_literals(self):
+        self.assertEqual(literal(None), "null")
+        self.assertEqual(literal(True), "true")
+        self.assertEqual(literal(3), "3")
+        self.assertEqual(literal(0.5), "0.5")
+        self.assertEqual(literal([1, u"a"]), u"[1, 'a']")
+        self.assertEqual(literal({"a": u"b'"}), '{"a": "b\'"}')
+        self.assertRaises(ValueError, literal, object())
+
+    def test_rid_literal(self):
+        self.assertEqual(rid_literal("#1:2"), "#1:2")
+        self.assertEqual(rid_literal(("#1:2", "#3:4")), "[#1:2, #3:4]")
+        for rid in ("1:2", "#1:2 or 1=1", "#a:b", 12, None):
+            self.assertRaises(ValueError, rid_literal, rid)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import unittest
+from pyorient.otypes import OrientRecord, OrientRecordLink
+
+from WrappedRecord import WrappedRecord, WrappedNode, WrappedEdge
+from RecordFixtures import fixture_records
+
+
+class WrappedRecordTest(unittest.TestCase):
+    def wrap(self, records, links):
+        for r in records:
+            wr = WrappedRecord.from_record(r, links)
+            links[wr.rid] = wr
+        return links
+
+    def test_from_record(self):
+        links = self.wrap(fixture_records(1, n_derived = 2), {})
+        self.assertIsInstance(links["#16:0"], WrappedNode)
+        self.assertIsInstance(links["#18:0"], WrappedEdge)
+        self.assertEqual(links["#17:0"].data["translations"], ["book", "letter"])
+        self.assertNotIn("in_HasDerivation", links["#17:0"].data)
+
+    def test_update_endpoints_after_decoding(self):
+        links = self.wrap(fixture_records(1, n_derived = 1), {})
+        e = links["#18:0"]
+        e.data
+        e.update_endpoints()
+        self.assertIs(e.out, links["#16:0"])
+        self.assertIs(e.in_, links["#17:0"])
+        self.assertEqual(links["#16:0"].outE, [e])
+
+    def test_resolve_without_links(self):
+        r = OrientRecord({"__rid": "#17:0", "__version": 1,
+                          "__o_class": "Noun", "root": OrientRecordLink("16:0")})
+        self.assertIsNone(WrappedRecord.from_record(r, {}).data["root"])
+        self.assertIsNone(WrappedRecord.from_record(r).data["root"])
+
+
+if __name__ == "__main__":
+    unittest.main()
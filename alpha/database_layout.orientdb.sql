@@ -85,6 +85,12 @@ CREATE INDEX ArabicNode.unvocalized_label NOTUNIQUE_HASH_INDEX
  */
 CREATE CLASS Root EXTENDS ArabicNode
 
+/* Every ArabicNode stores the root it is derived from as root_rid, including
+ * the root itself, see RootFamily.
+ */
+CREATE PROPERTY ArabicNode.root_rid LINK Root
+CREATE INDEX ArabicNode.root_rid NOTUNIQUE_HASH_INDEX
+
 
 /* Node class: Word (abstact)
  * Adds properties:
@@ -219,6 +225,27 @@ ALTER PROPERTY NounDerivationEdge.type REGEXP "pa|pp|masdar|time|place|tool|plur
 CREATE CLASS InformationEdge EXTENDS Edge
 
 
+/* --------------------------------------------------------
+ * Materialized subgraphs
+ * -------------------------------------------------------- */
+
+/* Document class: RootFamily
+ *
+ * The subgraph of a root, i.e. all nodes derived from it, their edges and
+ * their translations, as a single document. Maintained by ArabicWordGraph on
+ * writes, so that a subgraph is read by an index lookup and a single record
+ * read instead of a traversal.
+ *
+ * Properties:
+ *  - root_rid: the root (unique index)
+ *  - records: the records of the subgraph serialized as JSON
+ */
+CREATE CLASS RootFamily
+CREATE PROPERTY RootFamily.root_rid LINK Root
+CREATE PROPERTY RootFamily.records STRING
+CREATE INDEX RootFamily.root_rid UNIQUE_HASH_INDEX
+
+
 
 
 
@@ -6,11 +6,89 @@ Created on Feb 9, 2016
 @author: mirko
 '''
 
-import json, sys
+import json, re, sys, codecs, time, resource
+from array import array
 from collections import defaultdict
 from pyarabic import araby
 
-class ArabicDictionaryEntry:
+def iter_json_array(f, chunk_size = 1 << 16, depth = 1):
+    """
+    Incrementally parses a file object containing a json array, yielding its
+    elements one by one. Only the current element is kept in memory.
+    
+    With depth 2, the array's elements must be arrays themselves and their
+    elements are yielded instead, and so on.
+    
+    """
+    decoder = json.JSONDecoder()
+    buf, pos = f.read(chunk_size), 0
+    while buf and buf.isspace():
+        buf = f.read(chunk_size)
+    buf = buf.lstrip()
+    if not buf.startswith("["):
+        raise ValueError("Not a json array")
+    buf, level = buf[1:], 1
+    while True:
+        # Skip whitespace and separators, refilling the buffer when exhausted
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                break
+            buf, pos = f.read(chunk_size), 0
+            if not buf:
+                raise ValueError("Unterminated json array")
+        if buf[pos] == "]":
+            level -= 1
+            if not level:
+                return
+            pos += 1
+            continue
+        if level < depth:
+            # Descend into the enclosing arrays
+            if buf[pos] != "[":
+                raise ValueError("Not a json array at depth %d" % depth)
+            level += 1
+            pos += 1
+            continue
+        # Read until the element can be decoded completely. An element not
+        # followed by a separator may be a number continued in the next chunk.
+        while True:
+            try:
+                (element, end) = decoder.raw_decode(buf, pos)
+                if end < len(buf) and buf[end] in " \t\r\n,]":
+                    break
+                error = None
+            except ValueError as e:
+                error = e
+            more = f.read(max(chunk_size, len(buf)))
+            if not more:
+                if error:
+                    raise error
+                break
+            buf, pos = buf[pos:] + more, 0
+        pos = end
+        yield element
+        buf, pos = buf[pos:], 0
+
+
+## Table of interned unicode strings, see intern_string()
+_interned_strings = {}
+
+def intern_string(s):
+    """
+    Returns the canonical instance of the given string, like intern(), but
+    working for unicode strings, too.
+    
+    """
+    return _interned_strings.setdefault(s, s)
+
+
+class ArabicDictionaryEntry(object):
+    # Entries are numerous, avoid having a __dict__ per instance
+    __slots__ = ("citation_form", "entry_type", "root", "pattern", "stem",
+                 "translations", "entry_id", "_metadata")
+
     ROMAN_TO_INT = defaultdict(int, {
         "I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "VI": 6,
         "VII": 7, "VIII": 8, "IX": 9, "X": 10})
@@ -27,20 +105,37 @@ class ArabicDictionaryEntry:
         - translations: array of strings
         - metadata: dictionary
         
+        Strings shared between many entries are interned, translations are
+        stored as a tuple.
+        
         """
         self.citation_form = citation_form
-        self.entry_type = entry_type
-        self.root = root
-        self.pattern = pattern
+        self.entry_type = intern_string(entry_type)
+        self.root = intern_string(root)
+        self.pattern = intern_string(pattern)
         self.stem = stem
-        self.translations = translations
+        self.translations = tuple(intern_string(t) for t in translations)
         self.entry_id = entry_id
-        if not metadata:
-            metadata = {}
-        self.metadata = metadata
+        self._metadata = metadata
+
+    @property
+    def metadata(self):
+        """ Returns the metadata dictionary, creating it on first access """
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
 
     @staticmethod
     def from_elixirfm_json(data):
+        return ArabicDictionaryEntry(*ArabicDictionaryEntry.parse_elixirfm_json(data))
+
+    @staticmethod
+    def parse_elixirfm_json(data):
+        """
+        Returns the fields of the entry given as ElixirFM json, i.e. the
+        arguments of __init__() up to entry_id, without creating an entry.
+        
+        """
         if len(data) > 2:
             # FIXME
             # For Verbs: Imperative form (imperfect vocal), Masdar
@@ -60,8 +155,8 @@ class ArabicDictionaryEntry:
         # stem = ArabicDictionaryEntry.ROMAN_TO_INT[data[1:-1]]
         stem = data[1:-1]
         
-        node = ArabicDictionaryEntry(citation_form, entry_type, root, pattern, stem, translations, entry_id)
-        return node
+        return (citation_form, entry_type, root, pattern, stem, translations,
+                entry_id)
 
     def get_surface_forms(self):
         """
@@ -83,17 +178,31 @@ class ArabicDictionaryEntry:
 
 class ArabicDictionary:
     def __init__(self):
-        # Array of ArabicDictionaryEntry objects
+        # Array of ArabicDictionaryEntry objects, the index is the entry id
         self.entries = []
         # Set of known roots
         self.roots = set([])
-        # Dictionary: vocalized surface form -> array of ArabicDictionaryEntry objects
+        # Dictionary: vocalized surface form -> array of entry ids
         #   populated with plural, feminine forms, etc., too
-        self.entries_by_surface_form = defaultdict(list)
+        self.entries_by_surface_form = defaultdict(lambda: array("I"))
 
     def import_dump(self, fn):
-        raw = json.load(open(fn), "utf-8")
+        """ Adds all entries of the ElixirFM json dump at fn """
+        for (root_id, entries) in self.iter_dump(fn):
+            for entry in entries:
+                self.add_entry(entry)
+
+    @staticmethod
+    def iter_dump(fn, parse = ArabicDictionaryEntry.from_elixirfm_json):
+        """
+        Parses the ElixirFM json dump at fn incrementally, yielding a pair
+        (root id, list of ArabicDictionaryEntry objects) for every root. The
+        entries are created from the json of each derivation by parse.
         
+        Only a single root is held in memory at a time, the entries are not
+        added to any ArabicDictionary.
+        
+        """
         def flatten(a):
             if type(a) == unicode:
                 return a
@@ -102,16 +211,23 @@ class ArabicDictionary:
                 return a[0]
             return a 
         
-        raw = flatten(raw)
-        for r in raw:
+        f = codecs.open(fn, "r", "utf-8")
+        # Roots start with their id, a string. Dumps may wrap the array of
+        # roots in a single-element array (as in prototype/dump.json), which
+        # flatten() unwrapped when the dump was parsed as a whole.
+        depth = 2 if re.match(r"\s*\[\s*\[\s*\[", f.read(64)) else 1
+        f.seek(0)
+        for r in iter_json_array(f, depth = depth):
+            r = flatten(r)
             root_id = str(r[0]).translate(None, "()[],")
+            entries = []
             derivations = r[1][1:]
             for e in derivations:
                 try:
-                    entry = ArabicDictionaryEntry.from_elixirfm_json(e)
-                    self.add_entry(entry)
+                    entries.append(parse(e))
                 except:
                     print "Error parsing derivation from root id %s" % root_id
+            yield (root_id, entries)
                     
     def add_entry(self, entry):
         """
@@ -119,12 +235,15 @@ class ArabicDictionary:
         entries_by_surface_form.
         
         """
+        entry_id = len(self.entries)
         self.entries.append(entry)
         self.roots.add(entry.root)
         for s in entry.get_surface_forms():
             # Add vocalized and non-vocalized forms
-            self.entries_by_surface_form[s].append(entry)
-            self.entries_by_surface_form[araby.strip_tashkeel(s)].append(entry)
+            self.entries_by_surface_form[s].append(entry_id)
+            unvocalized = araby.strip_tashkeel(s)
+            if unvocalized != s:
+                self.entries_by_surface_form[unvocalized].append(entry_id)
         
     def search(self, citation_form):
         """
@@ -135,13 +254,70 @@ class ArabicDictionary:
         if citation_form not in self.entries_by_surface_form:
             citation_form = araby.strip_tashkeel(citation_form)
 
-        try:
-            return self.entries_by_surface_form[citation_form]
-        except IndexError:
-            return []
+        entry_ids = self.entries_by_surface_form.get(citation_form, ())
+        return [self.entries[i] for i in entry_ids]
         
 if __name__ == '__main__':
+    import os
+
+    def load_baseline(fn):
+        """
+        Loads the dump at fn into the representation used before entries had
+        slots: a dict per entry (the instance __dict__ of a classic class)
+        with its own metadata dict, translations as list, no interned strings
+        and the surface form index holding lists of entries.
+        
+        """
+        fields = ("citation_form", "entry_type", "root", "pattern", "stem",
+                  "translations", "entry_id")
+        def parse(e):
+            d = dict(zip(fields, ArabicDictionaryEntry.parse_elixirfm_json(e)))
+            d["metadata"] = {}
+            return d
+        entries = []
+        entries_by_surface_form = defaultdict(list)
+        for (root_id, dump_entries) in ArabicDictionary.iter_dump(fn, parse):
+            for d in dump_entries:
+                entries.append(d)
+                s = d["citation_form"]
+                entries_by_surface_form[s].append(d)
+                entries_by_surface_form[araby.strip_tashkeel(s)].append(d)
+        return entries
+
+    def load(fn):
+        l = ArabicDictionary()
+        l.import_dump(fn)
+        return l.entries
+
+    def measure(f, fn):
+        """
+        Runs f(fn) in a child process, so that the max RSS of each
+        representation is measured on its own. Returns the number of entries,
+        the seconds taken and the growth of max RSS in MB.
+        
+        """
+        (r, w) = os.pipe()
+        if os.fork() == 0:
+            try:
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                t0 = time.time()
+                n = len(f(fn))
+                os.write(w, "%d %f %d" % (n, time.time() - t0,
+                    (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024))
+            finally:
+                os._exit(0)
+        os.close(w)
+        result = os.read(r, 100).split()
+        os.wait()
+        if not result:
+            raise RuntimeError("Loading %s failed" % fn)
+        return (int(result[0]), float(result[1]), int(result[2]))
+
     fn = sys.argv[1]
+    for (name, f) in (("dict entries (baseline)", load_baseline),
+                      ("slotted entries", load)):
+        print "%s: loaded %d entries in %.1fs, max RSS grew by %d MB" \
+                % ((name, ) + measure(f, fn))
     l = ArabicDictionary()
     l.import_dump(fn)
     res = l.search(u"لاسلكي")    
@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import codecs, os
+
+class ImportJournal(object):
+    """
+    Append-only journal of the roots whose subgraphs have been committed to
+    the db, one root per line. Used to resume an interrupted import.
+
+    """
+    def __init__(self, fn):
+        """
+        Opens the journal at fn, reading the roots committed so far if it
+        already exists.
+
+        """
+        self.fn = fn
+        self.resumed = os.path.exists(fn)
+        self.committed_roots = set()
+        if self.resumed:
+            with codecs.open(fn, "r", "utf-8") as f:
+                self.committed_roots.update(l.rstrip("\n") for l in f)
+            self.committed_roots.discard(u"")
+        self.f = codecs.open(fn, "a", "utf-8")
+
+    def commit(self, roots):
+        """ Records given roots as committed and syncs the journal to disk """
+        if not roots:
+            return
+        self.f.write(u"".join(u"%s\n" % r for r in roots))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.committed_roots.update(roots)
+
+    def close(self):
+        self.f.close()
+
+    def __contains__(self, root):
+        return root in self.committed_roots
+
+    def __len__(self):
+        return len(self.committed_roots)
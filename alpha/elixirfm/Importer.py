@@ -5,40 +5,252 @@ Created on Mar 12, 2016
 
 @author: mirko
 '''
+import codecs, sys, time, argparse, multiprocessing
 from awg import ArabicWordGraph
 from ArabicDictionary import ArabicDictionary, ArabicDictionaryEntry
-from collections import defaultdict
+from ImportJournal import ImportJournal
+from collections import defaultdict, deque, OrderedDict
+from itertools import islice
 
 class Importer(object):
     def __init__(self, graph = None):
         if not graph:
             graph = ArabicWordGraph()
         self.graph = graph
-        ## map (translation, pos) -> OrientRecord
+        ## map (translation, pos) -> OrientRecord (or rid)
         self.added_translations = {}
+        # Keys of added_translations created by the current root
+        self.created_translations = []
+        self.start_time = time.time()
+        (self.imported_roots, self.imported_rows) = (0, 0)
         
-    def import_json_file(self, fn, skip_to = 1):
+    def import_json_file(self, fn, journal_fn = None, batch_roots = 50,
+                         workers = 1):
         """
-        Import ElixirFM lexicon from json file, optionally skipping the first
-        skip_to roots. This index is 1-based.
+        Import ElixirFM lexicon from json file. The file is parsed
+        incrementally, roots are imported while they are parsed.
+        
+        Committed roots are recorded in the journal at journal_fn (defaults to
+        fn + ".journal"). If the journal exists, the import is resumed, i.e.
+        roots found in the journal are skipped and already created translations
+        are loaded from the db, see load_translations().
+        
+        Nodes and edges are sent to the db in bulk, exactly one transaction
+        per batch_roots roots, which are journaled once it is committed. A
+        crash thus never leaves part of a chunk in the db, but it may leave a
+        committed chunk which is not journaled yet (with several workers,
+        until the parent has received the result of the chunk). Such a chunk
+        is imported again on resume, duplicating its roots. The transaction
+        size is bounded by batch_roots only (at least 1), see import_chunk().
+        
+        With more than one worker, roots are sharded across a process pool,
+        see import_roots_parallel().
         """
-        d = ArabicDictionary()
-        d.import_dump(fn)
-    
-        entries_by_roots = defaultdict(list)
-        for e in d.entries:
-            entries_by_roots[e.root].append(e)
-    
-        N = len(entries_by_roots)
-        for (n, (root, entries)) in enumerate(entries_by_roots.iteritems()):
-            if n + 1 < skip_to:
-                continue
-            sys.stdout.write("\rImporting root %d/%d" % (n + 1, N))
+        journal = ImportJournal(journal_fn or fn + ".journal")
+        if journal.resumed:
+            self.load_translations()
+
+        self.start_time = time.time()
+        (self.imported_roots, self.imported_rows) = (0, 0)
+        batch_roots = max(batch_roots, 1)
+        if workers > 1:
+            self.import_roots_parallel(fn, journal, batch_roots, workers)
+        else:
+            self.import_roots(self.iter_roots(fn, journal), journal, batch_roots)
+        journal.close()
+        sys.stdout.write("\n")
+
+    def import_dump(self, fn, batch_roots = 50):
+        """
+        Imports the ElixirFM lexicon from the json file at fn without a
+        journal, e.g. into a MemoryGraph.
+        
+        """
+        for chunk in self.iter_chunks(self.iter_roots(fn, ()), batch_roots):
+            self.imported_roots += len(self.import_chunk(chunk)[0])
+            self.report_progress(self.imported_roots)
+        sys.stdout.write("\n")
+
+    @staticmethod
+    def iter_roots(fn, journal):
+        """
+        Yields (root, entries) pairs while parsing the json file at fn,
+        skipping roots found in the journal. Only the current root is kept in
+        memory, see ArabicDictionary.iter_dump().
+        
+        Entries are grouped by their own root, not by the array element of
+        the dump they are found in. Entries of the same root in consecutive
+        elements are merged. As the dump is not held in memory, a root
+        reappearing after another one raises a RuntimeError.
+        
+        """
+        seen_roots = set()
+        (current_root, current_entries) = (None, [])
+        for (root_id, entries) in ArabicDictionary.iter_dump(fn):
+            entries_by_root = OrderedDict()
+            for e in entries:
+                entries_by_root.setdefault(e.root, []).append(e)
+            for (root, root_entries) in entries_by_root.iteritems():
+                if root == current_root:
+                    current_entries += root_entries
+                    continue
+                if root in seen_roots:
+                    raise RuntimeError("Entries of root %s are not contiguous "
+                                       "in dump (root id %s)" % (root, root_id))
+                if current_root is not None and current_root not in journal:
+                    yield (current_root, current_entries)
+                seen_roots.add(root)
+                (current_root, current_entries) = (root, root_entries)
+        if current_root is not None and current_root not in journal:
+            yield (current_root, current_entries)
+
+    @staticmethod
+    def iter_chunks(roots, chunk_size):
+        """ Yields lists of chunk_size (root, entries) pairs """
+        roots = iter(roots)
+        chunk = list(islice(roots, chunk_size))
+        while chunk:
+            yield chunk
+            chunk = list(islice(roots, chunk_size))
+
+    def import_roots(self, roots, journal, batch_roots = 50):
+        """
+        Imports (root, entries) pairs from given iterable in this process, see
+        import_json_file().
+        
+        """
+        self.graph.begin_bulk_load(max_statements = None)
+        for chunk in self.iter_chunks(roots, max(batch_roots, 1)):
+            self.commit_chunk(journal, self.import_chunk(chunk))
+        self.graph.end_bulk_load()
+
+    def import_roots_parallel(self, fn, journal, batch_roots = 50, workers = 4):
+        """
+        Imports the roots of the json file at fn using a pool of worker
+        processes, each having its own db connection. Roots are independent
+        subgraphs, so chunks of batch_roots roots are distributed to the
+        workers. The journal is written by this process only.
+        
+        Translations are shared between roots. To avoid duplicate ForeignNodes,
+        they are created in a pre-pass over the file by this process, see
+        create_foreign_nodes(), and passed to the workers as rids.
+        
+        At most two chunks per worker are parsed ahead, bounding memory usage.
+        
+        """
+        self.create_foreign_nodes(e for (root, entries)
+                                  in self.iter_roots(fn, journal)
+                                  for e in entries)
+        translation_rids = dict((k, n.rid) for (k, n)
+                                in self.added_translations.iteritems())
+
+        pool = multiprocessing.Pool(workers, _init_worker,
+                                    (translation_rids, ))
+        pending = deque()
+        for chunk in self.iter_chunks(self.iter_roots(fn, journal),
+                                      max(batch_roots, 1)):
+            pending.append(pool.apply_async(_import_chunk, (chunk, )))
+            if len(pending) >= 2 * workers:
+                self.commit_chunk(journal, pending.popleft().get())
+        while pending:
+            self.commit_chunk(journal, pending.popleft().get())
+        pool.close()
+        pool.join()
+
+    def commit_chunk(self, journal, result):
+        """
+        Records the result of import_chunk() in the journal and reports
+        progress.
+        
+        """
+        (roots, rows) = result
+        journal.commit(roots)
+        self.imported_roots += len(roots)
+        self.imported_rows += rows
+        self.report_progress(len(journal))
+
+    def import_chunk(self, roots):
+        """
+        Imports given list of (root, entries) pairs and flushes them. Returns
+        the list of committed roots and the number of rows sent to the db (the
+        latter is only known in bulk load mode).
+        
+        For the journal to be consistent with the db, import_roots() and the
+        workers put the graph in bulk load mode without automatic flushes
+        (max_statements None), so that the chunk is committed as a single
+        transaction by the final flush. Raises a RuntimeError if the bulk
+        loader flushes automatically.
+        
+        Roots failing with a RuntimeError are reported and considered as
+        committed, as retrying them would fail again. In bulk load mode, the
+        statements and translations the failed root has buffered are dropped,
+        so that the root is not committed partially.
+        
+        """
+        bulk_loader = self.graph.bulk_loader
+        if bulk_loader and bulk_loader.max_statements:
+            raise RuntimeError("Chunks must be committed as one transaction, "
+                               "bulk loader flushes every %d statements"
+                               % bulk_loader.max_statements)
+        rows = bulk_loader.rows if bulk_loader else 0
+        for (root, entries) in roots:
+            savepoint = bulk_loader.savepoint() if bulk_loader else None
+            self.created_translations = []
             try:
                 self.import_root(root, entries)
             except RuntimeError as e:
-                sys.stderr.write("Error while importing root %s: %s\n" % (root, e))
-    
+                _write(sys.stderr, u"Error while importing root %s: %s\n"
+                                   % (root, e))
+                if bulk_loader:
+                    bulk_loader.rollback(savepoint)
+                    for k in self.created_translations:
+                        del self.added_translations[k]
+        self.graph.flush()
+        if bulk_loader:
+            rows = bulk_loader.rows - rows
+        return ([root for (root, entries) in roots], rows)
+
+    def report_progress(self, done):
+        """
+        Writes progress line, done being the number of roots committed in
+        total, including previous runs.
+        
+        """
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        sys.stdout.write("\rImported %d roots (%.1f roots/s, %.0f rows/s)"
+                         % (done, self.imported_roots / elapsed,
+                            self.imported_rows / elapsed))
+
+    def load_translations(self):
+        """
+        Populates added_translations with the ForeignNodes created by a
+        previous import.
+        
+        """
+        for n in self.graph.get_foreign_nodes("elixirfm").nodes:
+            self.added_translations[(n.data["label"], n.data["pos"])] = n
+
+    def create_foreign_nodes(self, entries):
+        """
+        Creates ForeignNodes for all translations of the given entries which
+        have not been added yet, without connecting them.
+        
+        """
+        self.graph.begin_bulk_load()
+        for e in entries:
+            for t in e.translations:
+                if (t, e.entry_type) not in self.added_translations:
+                    self.added_translations[(t, e.entry_type)] = \
+                        self.graph.create_node("foreignnode", t, language = "en",
+                                               **self.translation_metadata(e.entry_type))
+        self.graph.end_bulk_load()
+
+    @staticmethod
+    def translation_metadata(pos):
+        """ Returns the properties of ForeignNodes created for translations """
+        return {"source": "elixirfm", "pos": pos,
+                "source_link": "http://quest.ms.mff.cuni.cz/cgi-bin/elixir"}
+
     def add_translations(self, node, pos, translations):
         """
         Adds translations of the word represented by node by connecting it to
@@ -46,8 +258,7 @@ class Importer(object):
         characterized by its surface form and its pos.
         
          """
-        metadata = {"source": "elixirfm", "pos": pos,
-                    "source_link": "http://quest.ms.mff.cuni.cz/cgi-bin/elixir"}
+        metadata = self.translation_metadata(pos)
 
         for t in translations:
             try:
@@ -56,6 +267,7 @@ class Importer(object):
             except:
                 n = self.graph.add_foreign_node(t, "en", node, metadata)
                 self.added_translations[(t, pos)] = n
+                self.created_translations.append((t, pos))
     
                 
     def import_root(self, root, entries):
@@ -96,7 +308,8 @@ class Importer(object):
         if not verb_entries:
             verb_entries.append(ArabicDictionaryEntry("", "V", entries[0].root, "",
                                                       entries[0].stem, []))
-            print "Invented verb of stem %s of root %s" % (e.stem, e.root) 
+            _write(sys.stdout, u"Invented verb of stem %s of root %s\n"
+                               % (e.stem, e.root))
         
         verb_nodes = []
         for e in verb_entries: 
@@ -146,10 +359,51 @@ class Importer(object):
                 for e in entries:
                     self.add_translations(n, e.entry_type, e.translations)
 
-import codecs, sys, os
-sys.stderr = codecs.getwriter('utf-8')(os.fdopen(sys.stderr.fileno(), 'w', 0), "delete")
-sys.stdout = codecs.getwriter('utf-8')(os.fdopen(sys.stdout.fileno(), 'w', 0), "replace")
+def _write(stream, s):
+    """
+    Writes the unicode string s to stream, encoding it as utf-8 unless stream
+    does, like the writers installed when run as script
+    
+    """
+    if not isinstance(stream, codecs.StreamWriter):
+        s = s.encode("utf-8")
+    stream.write(s)
+
+## Worker processes of Importer.import_roots_parallel
+_worker_importer = None
+
+def _init_worker(translation_rids):
+    """ Creates the worker's Importer having its own db connection """
+    global _worker_importer
+    _worker_importer = Importer()
+    _worker_importer.added_translations = translation_rids
+    _worker_importer.graph.begin_bulk_load(max_statements = None)
+
+def _import_chunk(roots):
+    return _worker_importer.import_chunk(roots)
+
 
 if __name__ == "__main__":
+    import os
+    sys.stderr = codecs.getwriter('utf-8')(os.fdopen(sys.stderr.fileno(), 'w', 0), "delete")
+    sys.stdout = codecs.getwriter('utf-8')(os.fdopen(sys.stdout.fileno(), 'w', 0), "replace")
+
+    parser = argparse.ArgumentParser(description = "Imports an ElixirFM json dump")
+    parser.add_argument("fn", help = "ElixirFM lexicon dumped as json")
+    parser.add_argument("--journal", default = None,
+                        help = "journal of committed roots used for resuming "
+                               "(default: FN.journal)")
+    parser.add_argument("--batch-roots", type = int, default = 50,
+                        help = "roots per transaction (at least 1)")
+    parser.add_argument("--workers", type = int, default = 1,
+                        help = "number of importing processes")
+    parser.add_argument("--root-families", action = "store_true",
+                        help = "materialize the subgraphs of all roots "
+                               "after importing")
+    args = parser.parse_args()
+
     importer = Importer()
-    importer = importer.import_json_file(sys.argv[1], skip_to = 5900)
+    importer.import_json_file(args.fn, args.journal, args.batch_roots, args.workers)
+    if args.root_families:
+        print "Materialized %d root families" \
+                % importer.graph.update_all_root_families()
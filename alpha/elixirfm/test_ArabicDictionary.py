@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import codecs, json, os, unittest
+from StringIO import StringIO
+from ArabicDictionary import ArabicDictionary, iter_json_array
+
+# Sample dump wrapping its two roots in a single-element array
+DUMP_FN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       "..", "..", "prototype", "dump.json")
+
+class IterJsonArrayTest(unittest.TestCase):
+    DOC = u''' [ {"a": [1, 2.5, "x, ]"]}, "\\"]\\"" ,[[], [3]], null,
+                 true, "كتب", -1e3 ,{"b": {"c": "]["}} ] '''
+
+    def parse(self, doc, chunk_size, depth = 1):
+        return list(iter_json_array(StringIO(doc), chunk_size, depth))
+
+    def test_like_json_load(self):
+        expected = json.loads(self.DOC)
+        for chunk_size in (1, 2, 3, 7, 64, 1 << 16):
+            self.assertEqual(self.parse(self.DOC, chunk_size), expected)
+
+    def test_empty(self):
+        self.assertEqual(self.parse(u"[]", 1), [])
+        self.assertEqual(self.parse(u" [ ] ", 4), [])
+
+    def test_depth(self):
+        doc = u"[[%s]]" % self.DOC
+        for chunk_size in (1, 5, 1 << 16):
+            self.assertEqual(self.parse(doc, chunk_size, 2),
+                             [json.loads(self.DOC)])
+            self.assertEqual(self.parse(doc, chunk_size, 3),
+                             json.loads(self.DOC))
+
+    def test_dump(self):
+        with codecs.open(DUMP_FN, "r", "utf-8") as f:
+            expected = json.load(f)[0]
+        for chunk_size in (13, 1 << 16):
+            with codecs.open(DUMP_FN, "r", "utf-8") as f:
+                self.assertEqual(list(iter_json_array(f, chunk_size, 2)),
+                                 expected)
+
+    def test_malformed(self):
+        for doc in (u"{}", u"[1, 2", u"[1, {]", u"[[1], 2]"):
+            self.assertRaises(ValueError, self.parse, doc, 2, 2)
+
+
+class ArabicDictionaryTest(unittest.TestCase):
+    def test_import_dump(self):
+        d = ArabicDictionary()
+        d.import_dump(DUMP_FN)
+        self.assertEqual(len(d.entries), 59)
+        self.assertEqual(len(d.roots), 2)
+
+    def test_iter_dump(self):
+        roots = list(ArabicDictionary.iter_dump(DUMP_FN))
+        self.assertEqual(len(roots), 2)
+        self.assertEqual(sum(len(entries) for (_, entries) in roots), 59)
+        e = roots[0][1][0]
+        self.assertEqual(e.citation_form, u"أَلِف")
+        self.assertEqual(e.entry_type, u"V")
+        self.assertEqual(e.root, u"ألف")
+        self.assertEqual(e.stem, u"I")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,15 +5,52 @@
 '''
 
 from externaldataproviders import ALL_PROVIDERS
+from ResultCache import ResultCache
+from WebQuery import WebQuery
 
 class AgglomerationProvider(object):
     """Helper class to query all known providers at a time """
-    def __init__(self):
-        self.providers = [P() for P in ALL_PROVIDERS]
+    def __init__(self, executor = None, **cache_options):
+        """
+        Creates all known providers, each with a ResultCache created with
+        the given options. All providers share the given QueryExecutor
+        (defaults to the shared one).
+        
+        """
+        self.providers = [P(ResultCache(**cache_options), executor)
+                          for P in ALL_PROVIDERS]
+
+    @property
+    def cache_stats(self):
+        """
+        Returns a dictionary: provider name -> cache counters, including the
+        number of coalesced queries. The counters of the requests coalesced
+        by url, shared by all web queries, are found under "web_requests".
+        
+        """
+        stats = dict((P.name, dict(P.cache.stats, coalesced = P.coalesced))
+                     for P in self.providers)
+        stats["web_requests"] = WebQuery.requests.stats
+        return stats
+
+    @property
+    def prefetch_stats(self):
+        """ Returns a dictionary: provider name -> prefetch counters """
+        return dict((P.name, P.prefetch_stats) for P in self.providers)
 
     def query(self, query_string):
         """ Returns a list of results, one for every known provider. """
         return [P.query(query_string) for P in self.providers]
 
+    def prefetch(self, query_strings, limit = None):
+        """
+        Prefetches the results for at most limit of the given query strings
+        with every provider, see ExternalDataProvider.prefetch
+        
+        """
+        for q in query_strings[:limit]:
+            for P in self.providers:
+                P.prefetch(q)
+
 
         
\ No newline at end of file
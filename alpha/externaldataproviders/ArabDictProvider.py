@@ -4,6 +4,7 @@
 @author: mirko
 '''
 
+import sys
 from bs4 import SoupStrainer
 
 from WebQuery import WebQuery
@@ -15,20 +16,42 @@ class ArabDictQueryBase(WebQuery, ExternalArabicDataQuery):
     
     """
     def parse_webpage(self, bs):
-        """ Parses the webpage passed as an BeautifulSoup object and returns a unicode """
-        translations = []
+        """
+        Parses the webpage passed as an BeautifulSoup object and returns a list
+        of (arabic term, translation) candidates
+        
+        """
+        candidates = []
 
         for div in bs.find_all("div", id = self._div_id_matcher):
             try:
                 s = div.find("a", {"class": "arabic-term"}).text
                 t = div.find("a", {"class": "latin-term"}).text
-
-                if self._matches_query(s):
-                    translations.append(t)
+                candidates.append((s, t))
                 
             except: pass
         
-        return ", ".join(translations)
+        return candidates
+
+    def extract_webpage(self, tree):
+        """ See WebQuery.extract_webpage """
+        candidates = []
+
+        for div in tree.iterfind(".//div[@id]"):
+            if not self._div_id_matcher(div.get("id")):
+                continue
+            s = div.find_class("arabic-term")
+            t = div.find_class("latin-term")
+            if not s or not t:
+                continue
+            candidates.append((unicode(s[0].text_content()),
+                               unicode(t[0].text_content())))
+
+        return candidates
+
+    def combine(self, texts):
+        """ See ExternalArabicDataQuery.combine """
+        return ", ".join(texts)
 
     def _get_soupstrainer(self):
         """ See WebQuery._get_soupstrainer """
@@ -44,7 +67,7 @@ class GermanArabDictQuery(ArabDictQueryBase):
     def url(self):
         """ Returns the query url as unicode string """
         return "http://www.arabdict.com/de/deutsch-arabisch/%s" \
-                % self.query_string
+                % self.lookup_string
 
 
 class EnglishArabDictQuery(ArabDictQueryBase):
@@ -52,7 +75,7 @@ class EnglishArabDictQuery(ArabDictQueryBase):
     def url(self):
         """ Returns the query url as unicode string """
         return "http://www.arabdict.com/en/english-arabic/%s" \
-                % self.query_string
+                % self.lookup_string
 
 
 class GermanArabDictProvider(ExternalDataProvider):
@@ -72,5 +95,9 @@ class EnglishArabDictProvider(ExternalDataProvider):
 
 
 if __name__ == '__main__':
-    GermanArabDictProvider().run_cli()
+    if len(sys.argv) > 2:
+        # Parser benchmark: query string and saved webpages of the query
+        GermanArabDictQuery.benchmark(sys.argv[1].decode("utf-8"), sys.argv[2:])
+    else:
+        GermanArabDictProvider().run_cli()
 
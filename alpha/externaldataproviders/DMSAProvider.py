@@ -4,6 +4,7 @@
 @author: mirko
 '''
 
+import sys
 from bs4 import SoupStrainer
 
 from WebQuery import WebQuery
@@ -16,13 +17,16 @@ class DMSAQuery(WebQuery, ExternalArabicDataQuery):
     
     """
     def parse_webpage(self, bs):
-        """ Parses the webpage passed as an BeautifulSoup object and returns a unicode """
+        """
+        Parses the webpage passed as an BeautifulSoup object and returns a list
+        of (arabic term, definition) candidates
+        
+        """
+        candidates = []
 
         for div in bs.find_all("div", class_ = "dataRecord dict_1"):
             try:
                 s = div.find("div", class_ = "termarAbicAr").text
-                if not self._matches_query(s):  
-                    continue
 
                 definition_div = div.find("div", class_ = "termDefintion")
                 # TODO: Investigate this hack ...
@@ -33,12 +37,37 @@ class DMSAQuery(WebQuery, ExternalArabicDataQuery):
                 more_link = definition_div.find("a")                
                 if more_link:
                     t = t[: -len(more_link.text)]
-                return t
+                candidates.append((s, t))
                 
                                 
             except: pass
 
-        return ""
+        return candidates
+
+    def extract_webpage(self, tree):
+        """ See WebQuery.extract_webpage """
+        candidates = []
+        for div in tree.iterfind(".//div[@class='dataRecord dict_1']"):
+            s = div.find_class("termarAbicAr")
+            definition_div = div.find_class("termDefintion")
+            if not s or not definition_div:
+                continue
+
+            definition_div = definition_div[0]
+            lines = definition_div.text_content().replace("\n", "").split(u"•")
+            t = u"\n".join(l.strip(u"،") for l in lines)
+
+            # Eventually strip المزيد ...
+            more_link = definition_div.find(".//a")
+            if more_link is not None:
+                t = t[: -len(more_link.text_content())]
+            candidates.append((unicode(s[0].text_content()), t))
+
+        return candidates
+
+    def combine(self, texts):
+        """ Returns the first matching definition, see ExternalArabicDataQuery.combine """
+        return texts[0] if texts else u""
 
     def _get_soupstrainer(self):
         return SoupStrainer("div", class_ = "dataRecord dict_1")
@@ -56,7 +85,7 @@ class DMSAQuery(WebQuery, ExternalArabicDataQuery):
     @property
     def url(self):
         """ Returns the query url as unicode string """
-        return u"http://www.arabdict.com/de/عربي-عربي/%s" % self.query_string
+        return u"http://www.arabdict.com/de/عربي-عربي/%s" % self.lookup_string
 
 
 class DMSAProvider(ExternalDataProvider):
@@ -67,5 +96,9 @@ class DMSAProvider(ExternalDataProvider):
     def name(self):  return u"معجم اللغة العربية المعاصرة" 
 
 if __name__ == '__main__':
-    DMSAProvider().run_cli()
+    if len(sys.argv) > 2:
+        # Parser benchmark: query string and saved webpages of the query
+        DMSAQuery.benchmark(sys.argv[1].decode("utf-8"), sys.argv[2:])
+    else:
+        DMSAProvider().run_cli()
 
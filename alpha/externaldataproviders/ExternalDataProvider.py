@@ -3,75 +3,307 @@
 '''
 @author: mirko
 '''
-from threading import Thread
-import sys
+from threading import Event, Lock
+import json, sys
 import awg.Tools
+from awg import Tracer
+from ResultCache import ResultCache
+from QueryExecutor import QueryExecutor
 
-class ExternalDataQuery(Thread):
+class ExternalDataQuery(object):
     """
-    Represents an asynchronous query to an ExternalDataProvider
+    Represents an asynchronous query to an ExternalDataProvider, run by a
+    QueryExecutor. Acts as a future: result waits for the query to finish.
+    
+    Queries with the same lookup string share a single fetch: the provider
+    runs and caches one query for the lookup string, the queries returned
+    for the query strings (e.g. vocalizations of a word) are variants of it,
+    deriving their results from its data, see variant() and
+    result_from_data().
     
     """
+    # Seconds result waits for the query to finish
+    DEFAULT_TIMEOUT = 10.0
     
     def __init__(self, query_string, provider):
-        Thread.__init__(self)
         self.query_string = query_string
         self._provider = provider
-        self._result = None
+        # Data fetched for the lookup string, see result_from_data()
+        self._data = None
+        self._done = Event()
+        # Exception raised by fetch(), if any
+        self._error = None
+        # Whether the query has been prefetched and not been requested yet
+        self.prefetched = False
+        # Query running the fetch, self unless this is a variant
+        self._fetching = self
+        
+    def variant(self, query_string):
+        """
+        Returns a query for query_string, which must have the same lookup
+        string, sharing the fetch of this query
         
+        """
+        if query_string == self.query_string:
+            return self
+        q = type(self)(query_string, self._provider)
+        q._fetching = self._fetching
+        return q
+
     def run(self):
+        """
+        Runs fetch(), recording errors, and notifies the provider when done.
+        
+        """
+        try:
+            self.fetch()
+        except Exception as e:
+            self._error = e
+        self._done.set()
+        self._provider.query_done(self)
+
+    def fetch(self):
+        """ Fetches the data for the lookup string and sets self._data """
         raise NotImplementedError
 
-    @property
-    def result(self):
+    def set_data(self, data):
+        """ Sets the data of a query that is not to be run """
+        self._data = data
+        self._done.set()
+
+    def set_error(self, error):
+        """ Marks a query that is not to be run as failed """
+        self._error = error
+        self._done.set()
+
+    def result_from_data(self, data):
         """
-        Returns the result of the query, waits for the query to be finished.
+        Returns the result of this query given the data fetched for the
+        lookup string. The data is the result by default.
         
         """
-        self.join()
-        return self._result
+        return data
+
+    def encode_data(self, data):
+        """ Returns data as unicode to be stored persistently """
+        return data
+
+    def decode_data(self, s):
+        """ Returns the data stored by encode_data(), None if invalid """
+        return s
+
+    def get_result(self, timeout = DEFAULT_TIMEOUT):
+        """
+        Returns the result of the query, waiting at most timeout seconds for
+        the query to be finished. Returns an empty string if the query failed
+        (see error), was dropped or has not finished in time.
+        
+        """
+        f = self._fetching
+        if not f._done.is_set():
+            with Tracer.shared().span("external_data_wait"):
+                f._done.wait(timeout)
+        if f._data is None:
+            return u""
+        return self.result_from_data(f._data)
+
+    @property
+    def result(self):
+        """ Returns the result of the query, see get_result() """
+        return self.get_result()
+
+    @property
+    def error(self):
+        """ Returns the exception raised by the fetch, if any """
+        return self._fetching._error
+
+    @property
+    def done(self):
+        """ Returns whether the query has finished """
+        return self._fetching._done.is_set()
+
+    @property
+    def failed(self):
+        """ Returns whether the query has finished with an error """
+        return self.done and self.error is not None
 
     @property
     def result_as_html(self):
         """ Returns the result as html, rendering lines as paragraphs """
-        return "\n".join("<p>%s</p>" % l for l in self.result.split("\n"))
+        result = self.result
+        if not result:
+            return u""
+        return "\n".join("<p>%s</p>" % l for l in result.split("\n"))
         
     @property
     def provider(self):
         """ Returns the name of the provider """
         return self._provider.name
 
+    @classmethod
+    def lookup_key(cls, query_string):
+        """
+        Returns the string to look up at the data source for query_string.
+        Queries with the same lookup string share their fetches.
+        
+        """
+        return query_string
+
+    @property
+    def lookup_string(self):
+        """ Returns the string to look up at the data source, see lookup_key() """
+        return self.lookup_key(self.query_string)
+
 class ExternalArabicDataQuery(ExternalDataQuery):    
+    """
+    Query for an arabic word. The data fetched for the word without tashkeel
+    is a list of (arabic word, text) candidates, the result of a query
+    combines the texts of the candidates whose vocalization is compatible
+    with the query string, see combine().
+    
+    """
     def _matches_query(self,s):
         """ Returns true if tashkeel is compatible and shaddas match"""
         return awg.Tools.is_vocalized_like(self.query_string, s)
 
+    @classmethod
+    def lookup_key(cls, query_string):
+        """
+        Returns the query string without tashkeel, results are filtered by
+        their vocalization using _matches_query
+        
+        """
+        return awg.Tools.strip_vocalization(query_string)
+
+    def result_from_data(self, data):
+        return self.combine([t for (s, t) in data if self._matches_query(s)])
+
+    def combine(self, texts):
+        """ Returns the result for the texts of the matching candidates """
+        raise NotImplementedError
+
+    def encode_data(self, data):
+        return json.dumps(data)
+
+    def decode_data(self, s):
+        try:
+            data = json.loads(s)
+        except ValueError:
+            return None
+        return data if isinstance(data, list) else None
+
 class ExternalDataProvider(object):
     """
     Represents an external data source that can be queried for additional
     information like a dictionary, wikipedia, etc.
     
-    Caches the results. 
+    Caches the results by lookup string, see ResultCache and
+    ExternalDataQuery.lookup_key(). Concurrent queries for the same lookup
+    string share a single fetch.
     
     """
     QueryClass = ExternalDataQuery
     
-    def __init__(self):
-        self.cache = {}
+    def __init__(self, cache = None, executor = None):
+        """
+        Creates a provider caching results in given ResultCache and running
+        queries with given QueryExecutor (defaults to the shared one).
+        
+        """
+        if cache is None:
+            cache = ResultCache()
+        self.cache = cache
+        self.executor = executor or QueryExecutor.shared()
+        self.lock = Lock()
+        # Number of queries answered by a query in flight
+        self.coalesced = 0
+        # Number of prefetched queries and of those requested later on
+        self.prefetched = 0
+        self.prefetch_hits = 0
     
     def query(self, query_string):
         """
         Immediately returns an ExternalData object, that runs the query
-        asynchronously. If this query has been run before, the cached result is
-        returned.
+        asynchronously. If the lookup string of this query has been fetched
+        before, the cached data is used.
+        
+        """
+        key = self.QueryClass.lookup_key(query_string)
+        with self.lock:
+            q = self.cache.get(key)
+            if q:
+                if q.prefetched:
+                    q.prefetched = False
+                    self.prefetch_hits += 1
+                    self.executor.promote(q)
+                elif not q.done:
+                    self.coalesced += 1
+                return q.variant(query_string)
+            # Cached right away so that concurrent callers get the same query
+            q = self.QueryClass(key, self)
+            self.cache.put(key, q)
+
+        persistent = self._get_persistent(q)
+        if persistent:
+            (data, added) = persistent
+            q.set_data(data)
+            self.cache.put(key, q, added)
+        else:
+            self.executor.submit(q)
+        return q.variant(query_string)
+
+    def prefetch(self, query_string):
+        """
+        Runs the query with low priority unless it is cached, so that a later
+        query() is likely to find the result in the cache. Returns whether the
+        query has been prefetched, it may be dropped under load.
+        
+        """
+        key = self.QueryClass.lookup_key(query_string)
+        if self.cache.get(key, False):
+            return False
+        q = self.QueryClass(key, self)
+        persistent = self._get_persistent(q)
+
+        with self.lock:
+            if self.cache.get(key, False):
+                return False
+            if persistent:
+                (data, added) = persistent
+                q.set_data(data)
+            elif self.executor.submit_prefetch(q):
+                added = None
+            else:
+                return False
+            q.prefetched = True
+            self.prefetched += 1
+            self.cache.put(key, q, added)
+        return True
+
+    @property
+    def prefetch_stats(self):
+        """ Returns a dictionary of prefetch counters and the hit rate """
+        return {"prefetched": self.prefetched, "hits": self.prefetch_hits,
+                "hit_rate": float(self.prefetch_hits) / (self.prefetched or 1)}
+
+    def query_done(self, q):
+        """ Called by queries when done, persists the data of successful ones """
+        if not q.failed:
+            self.cache.put_persistent(self.name, q.query_string,
+                                      q.encode_data(q._data))
+
+    def _get_persistent(self, q):
+        """
+        Returns a pair (data, time added) for the lookup string of query q
+        from the persistent tier of the cache, or None
         
         """
-        if query_string not in self.cache:
-            q = self.QueryClass(query_string, self)
-            q.start()
-            self.cache[query_string] = q
-            
-        return self.cache[query_string]
+        persistent = self.cache.get_persistent(self.name, q.query_string)
+        if persistent:
+            data = q.decode_data(persistent[0])
+            if data is not None:
+                return (data, persistent[1])
+        return None
     
     @property
     def name(self):
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import httplib, socket, urllib, urlparse, zlib
+from collections import defaultdict, deque
+from threading import Lock
+
+class HttpConnectionPool(object):
+    """
+    Thread-safe pool of persistent HTTP connections, kept alive between
+    requests to the same host. Requests are sent with a timeout and accept
+    gzip compressed responses.
+
+    """
+    MAX_REDIRECTS = 3
+
+    def __init__(self, timeout = 5.0, max_idle_per_host = 4, headers = None):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        self.headers.update(headers or {})
+        # (scheme, netloc) -> deque of idle connections
+        self.idle = defaultdict(deque)
+        self.lock = Lock()
+
+    def get(self, url, timeout = None):
+        """
+        Retrieves url (a utf-8 encoded or unicode string, not url encoded)
+        and returns the decompressed response body. Follows redirects.
+        Raises an IOError on HTTP errors, socket.timeout on timeouts.
+
+        """
+        if isinstance(url, unicode):
+            url = url.encode("utf-8")
+        for _ in range(self.MAX_REDIRECTS + 1):
+            (status, headers, body) = self._request(url, timeout or self.timeout)
+            if status in (301, 302, 303, 307) and "location" in headers:
+                url = urlparse.urljoin(url, headers["location"])
+                continue
+            if status != 200:
+                raise IOError("HTTP status %d for %s" % (status, url))
+            if headers.get("content-encoding") == "gzip":
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            return body
+        raise IOError("Too many redirects for %s" % url)
+
+    def _request(self, url, timeout):
+        """
+        Sends a GET request on a pooled connection, returns the triple
+        (status, headers, body). A request failing on a reused connection is
+        retried once on a new connection, not on another pooled one, as the
+        server may have closed it.
+
+        """
+        u = urlparse.urlsplit(url)
+        key = (u.scheme, u.netloc)
+        path = urlparse.urlunsplit(("", "", u.path or "/", u.query, ""))
+        # Url encode, keeping already encoded chars
+        path = urllib.quote(path, safe = "/%?&=+;:,@")
+
+        (conn, reused) = self._checkout(key, timeout)
+        while True:
+            try:
+                conn.request("GET", path, headers = self.headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if not reused:
+                    raise
+                # Other idle connections may be stale as well
+                (conn, reused) = (self._connect(key, timeout), False)
+                continue
+
+            headers = dict(response.getheaders())
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            return (response.status, headers, body)
+
+    def _checkout(self, key, timeout):
+        """ Returns a pair (connection, whether it is reused) """
+        with self.lock:
+            if self.idle[key]:
+                conn = self.idle[key].pop()
+                conn.timeout = timeout
+                if conn.sock:
+                    conn.sock.settimeout(timeout)
+                return (conn, True)
+        return (self._connect(key, timeout), False)
+
+    def _connect(self, key, timeout):
+        """ Returns a new, not yet connected connection """
+        (scheme, netloc) = key
+        cls = httplib.HTTPSConnection if scheme == "https" else httplib.HTTPConnection
+        return cls(netloc, timeout = timeout)
+
+    def _checkin(self, key, conn):
+        with self.lock:
+            if len(self.idle[key]) < self.max_idle_per_host:
+                self.idle[key].append(conn)
+                return
+        conn.close()
+
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+from collections import deque, defaultdict
+from threading import Thread, Condition
+
+class QueueFull(RuntimeError):
+    """ Set as error of queries rejected by a QueryExecutor """
+    pass
+
+
+class QueryExecutor(object):
+    """
+    Runs ExternalDataQuery objects on a fixed number of worker threads.
+
+    At most max_queued queries wait for execution, further queries are
+    rejected, i.e. they fail with a QueueFull error. For every provider, at
+    most provider_limit queries run at a time, unless the provider defines a
+    max_concurrent_queries attribute. Waiting queries of different providers
+    are served round robin.
+
+    Speculative queries (prefetches) are submitted with low priority: they
+    only run if no other query is waiting and are dropped if more than
+    max_prefetch_queued of them are waiting or if the executor is under load,
+    i.e. more than half of max_queued other queries are waiting.
+
+    """
+    _shared = None
+
+    @staticmethod
+    def shared():
+        """ Returns the executor shared by all providers not given one """
+        if not QueryExecutor._shared:
+            QueryExecutor._shared = QueryExecutor()
+        return QueryExecutor._shared
+
+    def __init__(self, workers = 8, max_queued = 200, provider_limit = 2,
+                 max_prefetch_queued = 50):
+        self.max_queued = max_queued
+        self.provider_limit = provider_limit
+        self.max_prefetch_queued = max_prefetch_queued
+        self.condition = Condition()
+        # provider -> deque of waiting queries
+        self.queued = defaultdict(deque)
+        # provider -> number of running queries
+        self.running = defaultdict(int)
+        # Providers in round robin order
+        self.providers = deque()
+        self.n_queued = 0
+        # Low priority queries, in order of submission
+        self.prefetch_queued = deque()
+        # Counters
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.prefetch_dropped = 0
+
+        for i in range(workers):
+            t = Thread(target = self._work, name = "QueryExecutor-%d" % i)
+            t.daemon = True
+            t.start()
+
+    def submit(self, query):
+        """
+        Queues query for execution. Returns False if the query has been
+        rejected, having failed with a QueueFull error.
+
+        """
+        with self.condition:
+            self.submitted += 1
+            if self.n_queued >= self.max_queued:
+                self.rejected += 1
+                query.set_error(QueueFull("%d queries waiting" % self.n_queued))
+                return False
+
+            p = query._provider
+            if p not in self.queued:
+                self.providers.append(p)
+            self.queued[p].append(query)
+            self.n_queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.n_queued)
+            self.condition.notify()
+            return True
+
+    def submit_prefetch(self, query):
+        """
+        Queues query with low priority. Returns False if the query has been
+        dropped, it is not run then and left unfinished.
+
+        """
+        with self.condition:
+            if len(self.prefetch_queued) >= self.max_prefetch_queued \
+                    or self.n_queued > self.max_queued / 2:
+                self.prefetch_dropped += 1
+                return False
+            self.prefetch_queued.append(query)
+            self.condition.notify()
+            return True
+
+    def promote(self, query):
+        """
+        Moves a query queued with low priority to the regular queue, e.g. when
+        its result is actually requested. Does nothing if it is not queued.
+
+        """
+        with self.condition:
+            try:
+                self.prefetch_queued.remove(query)
+            except ValueError:
+                return
+        self.submit(query)
+
+    def _limit(self, provider):
+        return getattr(provider, "max_concurrent_queries", self.provider_limit)
+
+    def _next_query(self):
+        """
+        Returns the next query of the first provider below its concurrency
+        limit, or None. Must be called holding the lock.
+
+        """
+        for _ in range(len(self.providers)):
+            p = self.providers[0]
+            self.providers.rotate(-1)
+            if self.running[p] < self._limit(p):
+                q = self.queued[p].popleft()
+                if not self.queued[p]:
+                    del self.queued[p]
+                    self.providers.remove(p)
+                self.n_queued -= 1
+                self.running[p] += 1
+                return q
+        if self.n_queued:
+            return None
+
+        for q in self.prefetch_queued:
+            p = q._provider
+            if self.running[p] < self._limit(p):
+                self.prefetch_queued.remove(q)
+                self.running[p] += 1
+                return q
+        return None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                q = self._next_query()
+                while not q:
+                    self.condition.wait()
+                    q = self._next_query()
+            try:
+                q.run()
+            finally:
+                with self.condition:
+                    self.running[q._provider] -= 1
+                    self.completed += 1
+                    # Waiting queries of this provider may run now
+                    self.condition.notify_all()
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of queue depth and throughput counters """
+        with self.condition:
+            return {"queued": self.n_queued,
+                    "running": sum(self.running.itervalues()),
+                    "max_queue_depth": self.max_queue_depth,
+                    "submitted": self.submitted, "rejected": self.rejected,
+                    "completed": self.completed,
+                    "prefetch_queued": len(self.prefetch_queued),
+                    "prefetch_dropped": self.prefetch_dropped}
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import sqlite3, time
+from collections import OrderedDict
+from threading import Lock
+
+class ResultCache(object):
+    """
+    Size and time bounded LRU cache of ExternalDataQuery objects, used by
+    ExternalDataProvider.
+
+    Entries expire ttl seconds after having been added, failed queries after
+    negative_ttl seconds, so that they are retried. If more than max_size
+    entries are cached, the least recently used one is evicted.
+
+    If persistent_fn is given, results of successful queries are stored in a
+    sqlite database, too, so that they survive restarts. Entries found there
+    are subject to the same ttl.
+
+    Expired entries are counted as evictions when they are looked up.
+
+    """
+    def __init__(self, max_size = 10000, ttl = 7 * 86400, negative_ttl = 300,
+                 persistent_fn = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # query key -> (query, time added)
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.db = None
+        if persistent_fn:
+            self.db = sqlite3.connect(persistent_fn, check_same_thread = False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results "
+                            "(provider TEXT, query TEXT, result TEXT, added REAL, "
+                            "PRIMARY KEY (provider, query))")
+            self.db.commit()
+
+    def get(self, key, count = True):
+        """
+        Returns the cached query for key or None if there is none or if it
+        has expired. Set count to False for lookups not to be counted as hits
+        or misses.
+
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry and not self._is_expired(*entry):
+                # Re-insert as most recently used
+                self.entries[key] = entry
+                self.hits += count
+                return entry[0]
+            if entry:
+                self.evictions += 1
+            self.misses += count
+            return None
+
+    def put(self, key, query, added = None):
+        """ Adds a query, evicting the least recently used ones if needed """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (query, added or time.time())
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last = False)
+                self.evictions += 1
+
+    def _is_expired(self, query, added):
+        ttl = self.negative_ttl if query.failed else self.ttl
+        return time.time() - added > ttl
+
+    ## ---------------------------------------------------------------------
+    ## Persistent tier
+
+    def get_persistent(self, provider, key):
+        """
+        Returns a pair (result, time added) from the persistent tier or None
+        if there is no such entry or if it has expired.
+
+        """
+        if not self.db:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT result, added FROM results "
+                                  "WHERE provider = ? AND query = ?",
+                                  (provider, key)).fetchone()
+        if not row or time.time() - row[1] > self.ttl:
+            return None
+        return row
+
+    def put_persistent(self, provider, key, result, added = None):
+        """ Stores the result of a successful query in the persistent tier """
+        if not self.db:
+            return
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                            (provider, key, result, added or time.time()))
+            self.db.commit()
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of counters """
+        return {"size": len(self.entries), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self.entries)
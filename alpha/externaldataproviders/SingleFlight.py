@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+from threading import Event, Lock
+
+class _Call(object):
+    """ A call in flight, shared by all callers asking for the same key """
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key: while a call for a key is in
+    flight, further callers wait for it and share its result (or exception)
+    instead of calling again. Results are not cached beyond the call.
+
+    """
+    def __init__(self):
+        self.lock = Lock()
+        # key -> _Call in flight
+        self.calls = {}
+        # Counters
+        self.n_calls = 0
+        self.coalesced = 0
+
+    def do(self, key, f, *args):
+        """ Returns f(*args), unless a call for key is in flight already """
+        with self.lock:
+            self.n_calls += 1
+            call = self.calls.get(key)
+            if call:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = f(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of counters """
+        return {"calls": self.n_calls, "coalesced": self.coalesced,
+                "in_flight": len(self.calls)}
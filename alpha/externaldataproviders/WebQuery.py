@@ -4,27 +4,67 @@
 @author: mirko
 '''
 
-import urllib2
+import gc, time
 from bs4 import BeautifulSoup, SoupStrainer
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
 from ExternalDataProvider import ExternalDataQuery 
+from HttpConnectionPool import HttpConnectionPool
+from SingleFlight import SingleFlight
 
 class WebQuery(ExternalDataQuery):
     """
     Represents an asynchronous query to a WebDataProvider
 
+    All WebQueries share a pool of persistent HTTP connections. Concurrent
+    queries for the same url share a single request.
+
+    Pages are parsed by extract_webpage() if lxml is available and the
+    subclass implements it, falling back to BeautifulSoup and
+    parse_webpage() otherwise. Both must return the same result.
+
     """
-    def run(self):
+    # Whether to use extract_webpage(), if implemented
+    fast_parsing = lxml is not None
+
+    http = HttpConnectionPool(timeout = 5.0, headers = {
+        "User-Agent": "ShabakaWebQuery/0.1 +http://shabaka.redredblue.de"})
+    requests = SingleFlight()
+
+    def fetch(self):
         """
-        Retrieves the web page at self.url and parses the result by calling
-        self.parse_webpage(). Finally sets self._result.
+        Retrieves the web page at self.url and parses the data by calling
+        self.parse_document(). Finally sets self._data.
         
         """
-        request = urllib2.Request(self.url.encode("utf-8"))
-        request.add_header('User-Agent', 'ShabakaWebQuery/0.1 +http://shabaka.redredblue.de')
-        doc = urllib2.build_opener().open(request).read()
+        url = self.url
+        doc = self.requests.do(url, self.http.get, url)
+        self._data = self.parse_document(doc)
 
+    def parse_document(self, doc, fast = None):
+        """
+        Parses the raw webpage doc and returns the data (see
+        ExternalDataQuery.result_from_data()), using the fast path unless
+        fast is False.
+        
+        """
+        if fast is None:
+            fast = self.fast_parsing
+        if fast:
+            try:
+                return self.extract_webpage(self._parse_lxml(doc))
+            except NotImplementedError:
+                pass
         bs = BeautifulSoup(doc, parse_only = self._get_soupstrainer())
-        self._result = self.parse_webpage(bs)
+        return self.parse_webpage(bs)
+
+    @staticmethod
+    def _parse_lxml(doc):
+        # Parsers must not be shared between threads
+        parser = lxml.html.HTMLParser(encoding = "utf-8")
+        return lxml.html.document_fromstring(doc, parser = parser)
 
     def _get_soupstrainer(self):
         """
@@ -36,8 +76,52 @@ class WebQuery(ExternalDataQuery):
         return None
 
     def parse_webpage(self, bs):
-        """ Parses the webpage passed as an BeautifulSoup object and returns a unicode """
+        """ Parses the webpage passed as an BeautifulSoup object and returns the data """
         raise NotImplementedError
+
+    def extract_webpage(self, tree):
+        """
+        Parses the webpage passed as lxml tree and returns the data. Optional
+        fast path for parse_webpage(), not implemented by default.
+        
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def benchmark(cls, query_string, fns, repeat = 10):
+        """
+        Parses the saved webpages fns with both parsers and prints the time
+        per page and the number of objects allocated while parsing.
+        
+        """
+        q = cls(query_string, None)
+        docs = [open(fn).read() for fn in fns]
+        results = []
+        for fast in (False, True):
+            if fast and not lxml:
+                print "lxml not available"
+                break
+            results.append([q.parse_document(doc, fast) for doc in docs])
+            t = time.time()
+            for _ in range(repeat):
+                for doc in docs:
+                    q.parse_document(doc, fast)
+            t = (time.time() - t) / (repeat * len(docs))
+
+            gc.collect()
+            gc.disable()
+            n = len(gc.get_objects())
+            trees = [q._parse_lxml(doc) if fast else
+                     BeautifulSoup(doc, parse_only = q._get_soupstrainer())
+                     for doc in docs]
+            n = (len(gc.get_objects()) - n) / len(docs)
+            gc.enable()
+            del trees
+
+            print "%-13s %.2f ms/page, %d objects/page" \
+                  % ("lxml:" if fast else "BeautifulSoup:", t * 1000, n)
+        if len(results) == 2 and results[0] != results[1]:
+            print "Results differ"
     
     @property
     def url(self):
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import gzip, socket, threading, unittest
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+from HttpConnectionPool import HttpConnectionPool
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """ Answers every GET with its path, keeping the connection open """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections.append(self.connection)
+
+    def do_GET(self):
+        body = self.path
+        self.send_response(200)
+        if self.path.startswith("/gzip"):
+            buf = StringIO()
+            with gzip.GzipFile(fileobj = buf, mode = "wb") as f:
+                f.write(body)
+            body = buf.getvalue()
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), KeepAliveHandler)
+        # Sockets of all accepted connections
+        self.connections = []
+
+    def drop_connections(self):
+        """ Closes all connections, leaving the client's ones stale """
+        for c in self.connections:
+            try:
+                c.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            c.close()
+
+
+class HttpConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.key = ("http", "127.0.0.1:%d" % self.server.server_address[1])
+        self.url = "http://%s/" % self.key[1]
+        self.pool = HttpConnectionPool(timeout = 5.0)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.drop_connections()
+        self.server.server_close()
+
+    def test_get(self):
+        self.assertEqual(self.pool.get(self.url + "a?b=c d"), "/a?b=c%20d")
+        self.assertEqual(self.pool.get(self.url + "gzip"), "/gzip")
+
+    def test_reuse(self):
+        for i in range(3):
+            self.assertEqual(self.pool.get(self.url + str(i)), "/" + str(i))
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(len(self.pool.idle[self.key]), 1)
+
+    def test_retry_on_fresh_connection(self):
+        # Two idle connections, both closed by the server
+        conns = [self.pool._checkout(self.key, 5.0)[0] for i in range(2)]
+        for conn in conns:
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            self.pool._checkin(self.key, conn)
+        self.server.drop_connections()
+
+        self.assertEqual(self.pool.get(self.url + "retry"), "/retry")
+        self.assertEqual(len(self.server.connections), 3)
+
+    def test_no_retry_on_new_connection(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertRaises(socket.error, self.pool.get, self.url)
+
+
+if __name__ == "__main__":
+    unittest.main()
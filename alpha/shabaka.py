@@ -6,12 +6,59 @@
 '''
 
 import cherrypy
-import os.path
+import logging, os.path
 
-from webinterface import TextWebInterface, GraphvizWebInterface
+from awg import ArabicWordGraph, ConnectionPool, MemoryGraph, SubgraphCache, \
+    Tracer
+from externaldataproviders import AgglomerationProvider
+from webinterface import TextWebInterface, GraphvizWebInterface, RenderCache, \
+    LayoutPool
 
 server_conf = {"server.socket_host": "0.0.0.0",
-               "server.socket_port":  8080 }
+               "server.socket_port":  8080,
+               "server.thread_pool": 10 }
+
+# One db connection per CherryPy worker thread at most
+pool_conf = {"min_size": 2,
+             "max_size": server_conf["server.thread_pool"],
+             "timeout": 10.0 }
+
+# Subgraphs of root families fetched from the db, expiring to pick up
+# changes made by other processes
+subgraph_cache_conf = {"max_records": 100000,
+                       "max_age": 600 }
+
+# Read subgraphs from materialized RootFamily documents, which requires them
+# to be created for all roots before, see
+# ArabicWordGraph.update_all_root_families
+root_families = False
+
+# Serve read-only from a graph held in memory instead of querying OrientDB:
+# None, "orientdb" for a snapshot of the db or the path of an ElixirFM dump
+memory_graph_source = None
+
+# Results of external data providers survive restarts
+cache_conf = {"max_size": 10000,
+              "ttl": 7 * 86400,
+              "negative_ttl": 300,
+              "persistent_fn": os.path.join(os.path.dirname(__file__),
+                                            "external_data.sqlite") }
+
+# Rendered graphs survive restarts, too
+render_cache_conf = {"max_size": 500,
+                     "directory": os.path.join(os.path.dirname(__file__),
+                                               "render_cache") }
+
+# Layouts run in separate processes, big graphs use dot or are simplified
+layout_conf = {"processes": 2,
+               "timeout": 10.0,
+               "max_queued": 20,
+               "dot_above": 150,
+               "simplify_above": 400 }
+
+# Tracing of requests: Tracer.OFF, Tracer.METRICS (served as json by
+# /gw/stats) or Tracer.LOG (additionally logs every request)
+trace_level = Tracer.OFF
 
 css_path = os.path.join(os.path.dirname(__file__), "web", "static", "main.css")
 app_conf = {
@@ -22,10 +69,33 @@ app_conf = {
 
 
 if __name__ == '__main__':
-    tx = TextWebInterface()
-    gw = GraphvizWebInterface()
+    Tracer.shared().level = trace_level
+    if trace_level >= Tracer.LOG:
+        logging.basicConfig()
+        logging.getLogger("shabaka.trace").setLevel(logging.INFO)
+
+    # Fork layout processes before any threads are started
+    layout_pool = LayoutPool(**layout_conf)
+    subgraph_cache = SubgraphCache(**subgraph_cache_conf)
+    if memory_graph_source and memory_graph_source != "orientdb":
+        # No db needed at all
+        from elixirfm.Importer import Importer
+        graph = MemoryGraph(subgraph_cache)
+        Importer(graph).import_dump(memory_graph_source)
+    elif memory_graph_source:
+        graph = MemoryGraph.from_orientdb(
+                ArabicWordGraph(pool = ConnectionPool(**pool_conf)),
+                subgraph_cache)
+    else:
+        graph = ArabicWordGraph(pool = ConnectionPool(**pool_conf),
+                                subgraph_cache = subgraph_cache,
+                                root_families = root_families)
+    tx = TextWebInterface(graph)
+    gw = GraphvizWebInterface(graph, RenderCache(**render_cache_conf),
+                              layout_pool)
     # Let them share an AgglomerationProvider to share its cache
-    tx.agglomeration_provider = gw.agglomeration_provider
+    tx.agglomeration_provider = gw.agglomeration_provider = \
+        AgglomerationProvider(**cache_conf)
 
     cherrypy.config.update(server_conf)
     cherrypy.tree.mount(tx, '/tx', "cherrypy.conf")
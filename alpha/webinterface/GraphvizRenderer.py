@@ -4,11 +4,11 @@
 @author: mirko
 '''
 
-import tempfile, os
+import hashlib
 import pygraphviz
 from collections import defaultdict
 
-from awg import ArabicWordGraph
+from awg import ArabicWordGraph, Tracer
 from awg.WrappedRecord import FakeEdge, FakeNode
 
 
@@ -22,14 +22,32 @@ class GraphvizRenderer(object):
     
     The result node or nodes are stored in self.result_nodes. 
     
+    If a RenderCache is given, rendered graphs are cached per node or query,
+    view and format. Increment VERSION when changing the drawing style to
+    invalidate cached graphs.
+    
+    If a LayoutPool is given, the layout runs in one of its processes, big
+    graphs are simplified by leaving out second order neighbours.
+    
+    Graphs of roots are drawn without layout if node positions have been
+    precomputed for all drawn nodes, see LayoutPrecomputer.
+    
     """
-    def __init__(self, graph = None):
+    VERSION = 1
+
+    def __init__(self, graph = None, cache = None, layout_pool = None):
         if not graph:
             graph = ArabicWordGraph()
         self.graph = graph
+        self.cache = cache
+        self.layout_pool = layout_pool
         self.G = pygraphviz.AGraph(directed = True, overlap = "scale")
         self.object_drawer = GraphVizObjectDrawer(self.G)
         self.result_nodes = []
+        # Identifies the view for caching, set when building the graph
+        self.cache_key = None
+        # Precomputed positions: rid -> "x,y"
+        self.positions = None
 
     def build_graph_for_query(self, q):
         """
@@ -41,11 +59,13 @@ class GraphvizRenderer(object):
          """
         res = self.graph.search_arabic(q, True)
         self.result_nodes = list(res.primary_results)
+        self.cache_key = ("search", q)
         if len(self.result_nodes) > 1:
             self._build_graph_for_query_results(q)
         else:
             self._build_graph_for_single_result(self.result_nodes[0])
-        self.object_drawer.draw_objects()
+        with Tracer.shared().span("drawer"):
+            self.object_drawer.draw_objects()
     
     def build_graph_for_node(self, rid):
         """
@@ -56,8 +76,35 @@ class GraphvizRenderer(object):
         r = rs.result_map.get(rid)
         if r:
             self.result_nodes = [r]
+            self.cache_key = ("node", rid)
             self._build_graph_for_single_result(r)
-            self.object_drawer.draw_objects()
+            with Tracer.shared().span("drawer"):
+                self.object_drawer.draw_objects()
+            if r.cls == "Root":
+                self.positions = r.data.get("layout")
+
+    @property
+    def neighbour_labels(self):
+        """
+        Returns the labels of the drawn nodes other than the result node of a
+        single result, i.e. the nodes likely to be visited next. Closer nodes
+        come first.
+        
+        """
+        single = self.result_nodes[0].rid if len(self.result_nodes) == 1 else None
+        ranked = []
+        for (o, fmts) in self.object_drawer.objects.iteritems():
+            if o.is_edge or o.rid == single:
+                continue
+            for (rank, fmt) in enumerate(("n_result", "n1", "n2")):
+                if fmt in fmts:
+                    ranked.append((rank, o.data["label"]))
+                    break
+        labels = []
+        for (rank, label) in sorted(ranked):
+            if label not in labels:
+                labels.append(label)
+        return labels
 
     def _build_graph_for_query_results(self, q):
         """
@@ -127,16 +174,96 @@ class GraphvizRenderer(object):
             self.object_drawer.add_object(e, "e2")
             self.object_drawer.add_object(parent, "n2")
 
+    @property
+    def fingerprint(self):
+        """
+        Returns a hash of the rids and versions of the drawn objects and of
+        the nodes their labels are taken from. As OrientDB increments the
+        version of a vertex when edges are added or removed, the fingerprint
+        changes with any change to the drawn graph.
+        
+        """
+        records = set()
+        for o in self.object_drawer.objects:
+            records.add(o)
+            if not o.is_edge and not isinstance(o, FakeNode):
+                records.update(o.outE)
+                records.update(e.in_ for e in o.outE if e.in_)
+        h = hashlib.sha1()
+        for s in sorted("%s:%s" % (r.rid, r.version) for r in records):
+            h.update(s)
+        return h.hexdigest()
+
     def render_graph(self, format = "svg"):
-        path = tempfile.mktemp(suffix = ".%s" % format)
-        self.render_graph_to_disk(path, format)
-        s = open(path).read()
-        os.unlink(path)
+        """
+        Layouts the graph and returns it in given format (e.g. svg, png or
+        json), from the cache if the drawn objects have not changed since it
+        has been rendered. Svg is returned without xml header and doctype.
         
+        """
+        if not self.cache or not self.cache_key:
+            return self._render_graph(format)
+
+        key = self.cache_key + (format, self.VERSION)
+        fingerprint = self.fingerprint
+        s = self.cache.get(key, fingerprint)
+        if s is None:
+            s = self._render_graph(format)
+            self.cache.put(key, fingerprint, s)
+        return s
+
+    def _render_graph(self, format):
+        # neato -n only routes edges, keeping the given node positions
+        args = "-n" if self._apply_positions() else ""
+        with Tracer.shared().span("layout"):
+            if self.layout_pool:
+                s = self._render_graph_in_pool(format, args)
+            else:
+                # Without a path, graphviz output is piped back instead of written
+                s = self.G.draw(format = format, prog = "neato", args = args)
         if format == "svg":
-            return "\n".join(s.split("\n")[6:])
+            return s[s.index("<svg"):]
         return s
 
+    def _render_graph_in_pool(self, format, args):
+        n_nodes = self.G.number_of_nodes()
+        if args:
+            prog = "neato"
+        else:
+            if n_nodes > self.layout_pool.simplify_above:
+                self._simplify()
+                n_nodes = self.G.number_of_nodes()
+            prog = self.layout_pool.prog_for(n_nodes)
+        return self.layout_pool.render(self.G.string(), format, prog, n_nodes,
+                                       args)
+
+    def _apply_positions(self):
+        """
+        Sets the precomputed positions as "pos" attributes, returns False if
+        there are none or if they do not cover all nodes.
+        
+        """
+        if not self.positions:
+            return False
+        nodes = self.G.nodes()
+        if any(n not in self.positions for n in nodes):
+            return False
+        for n in nodes:
+            n.attr["pos"] = self.positions[n]
+        return True
+
+    @property
+    def layout_positions(self):
+        """ Layouts the graph with neato, returns a map rid -> "x,y" """
+        self.G.layout(prog = "neato")
+        return dict((unicode(n), n.attr["pos"]) for n in self.G.nodes())
+
+    def _simplify(self):
+        """ Removes second order neighbours (and their edges) from the graph """
+        for (o, fmts) in self.object_drawer.objects.iteritems():
+            if not o.is_edge and set(fmts) == set(["n2"]):
+                self.G.remove_node(o.rid)
+
     def render_graph_to_disk(self, path, format = "svg"):
         """ Layouts graph and writes is in given format to path """
         self.G.draw(path, format = format, prog = "neato")
@@ -197,7 +324,6 @@ class GraphVizObjectDrawer(object):
     def draw_object(self, o, fmts):
             h = next(h for (fmt, h) in self.drawing_handlers
                      if fmt in fmts)
-            print o.rid, h.__name__
             h(o)
 
     ##################################################################
@@ -279,17 +405,38 @@ class GraphVizObjectDrawer(object):
     ## For debuggung
 
     def add_node(self, name, label, **kwargs):
-        print "N: %s (%s)" % (name, label)
         self.G.add_node(name, label = label, **kwargs) 
 
     def add_edge(self, from_, to, **kwargs):
-        print "E: %s -> %s" % (from_, to)
         self.G.add_edge(from_, to, **kwargs)
 
 
  
 if __name__ == '__main__':
-    import sys
+    import sys, os, tempfile, timeit
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        # Rendering latency via temp file and in memory, e.g. for a root:
+        # --benchmark 14:7015
+        rid = sys.argv[2] if len(sys.argv) > 2 else "14:7015"
+        renderer = GraphvizRenderer()
+        renderer.build_graph_for_node("#" + rid)
+
+        def render_via_tempfile(format):
+            path = tempfile.mktemp(suffix = ".%s" % format)
+            renderer.render_graph_to_disk(path, format)
+            s = open(path).read()
+            os.unlink(path)
+            return s
+
+        for format in ("svg", "png", "json"):
+            for (name, f) in (("temp file", render_via_tempfile),
+                              ("in memory", renderer._render_graph)):
+                t = min(timeit.repeat(lambda: f(format), number = 10,
+                                      repeat = 3)) / 10
+                print "%s, %s: %.1f ms" % (format, name, t * 1000)
+        sys.exit()
+
     renderer = GraphvizRenderer()
     renderer.build_graph_for_node("#14:7015") #Root
     renderer.render_graph_to_disk("test2.svg") 
@@ -4,20 +4,34 @@
 @author: mirko
 '''
 
-import cherrypy
+import cherrypy, json
 from Cheetah.Template import Template
-from awg import ArabicWordGraph
+from awg import ArabicWordGraph, Tracer, traced_request
 from GraphvizRenderer import GraphvizRenderer
+from LayoutPool import LayoutError
+from RenderCache import RenderCache
 from externaldataproviders import AgglomerationProvider
 
 class GraphvizWebInterface(object):
     """
     
     """
-    def __init__(self, graph = None):
+    # Number of neighbour nodes whose external data is prefetched per request
+    MAX_PREFETCH = 20
+
+    def __init__(self, graph = None, render_cache = None, layout_pool = None):
+        """
+        Creates the interface. Without a LayoutPool, layouts run on the
+        request threads.
+        
+        """
         if not graph:
             graph = ArabicWordGraph()
         self.graph = graph
+        if render_cache is None:
+            render_cache = RenderCache()
+        self.render_cache = render_cache
+        self.layout_pool = layout_pool
         self.agglomeration_provider = AgglomerationProvider()
 
     @cherrypy.expose
@@ -25,17 +39,23 @@ class GraphvizWebInterface(object):
         raise cherrypy.HTTPRedirect("show?rid=14:7015")
 
     @cherrypy.expose
+    @traced_request("gw/search")
     def search(self, q):
-        renderer = GraphvizRenderer()
+        renderer = self.renderer()
         renderer.build_graph_for_query(q)
         return self.instantiate_template(renderer)
     
     @cherrypy.expose
+    @traced_request("gw/show")
     def show(self, rid):
-        renderer = GraphvizRenderer()
+        renderer = self.renderer()
         renderer.build_graph_for_node("#" + rid)
         return self.instantiate_template(renderer)
     
+    def renderer(self):
+        """ Returns a new GraphvizRenderer """
+        return GraphvizRenderer(self.graph, self.render_cache, self.layout_pool)
+
     def instantiate_template(self, renderer):
         if len(renderer.result_nodes) == 1:    
             node = renderer.result_nodes[0]
@@ -43,17 +63,47 @@ class GraphvizWebInterface(object):
         else:
             node = None
             external_data = None
+        # Neighbours are likely to be visited next
+        self.agglomeration_provider.prefetch(renderer.neighbour_labels,
+                                             self.MAX_PREFETCH)
+        
+        try:
+            svg = renderer.render_graph()
+        except LayoutError as e:
+            svg = "<p>Graph could not be drawn: %s</p>" % e
         
         vars = { "node": node,
-                "svg": renderer.render_graph(),
+                "svg": svg,
                 "external_data": external_data }
         
-        tmpl = file("web/templates/graphviz.tmpl").read().decode("utf-8")
-        t = Template(tmpl, searchList = [vars])
-        return unicode(t).encode("utf8")
+        with Tracer.shared().span("template"):
+            tmpl = file("web/templates/graphviz.tmpl").read().decode("utf-8")
+            t = Template(tmpl, searchList = [vars])
+            return unicode(t).encode("utf8")
+
+    @cherrypy.expose
+    def stats(self):
+        """ Returns cache, prefetch, layout and tracing counters as json """
+        ap = self.agglomeration_provider
+        cherrypy.response.headers["Content-Type"] = "application/json"
+        return json.dumps({"subgraph_cache": self.graph.subgraph_cache.stats,
+                           "render_cache": self.render_cache.stats,
+                           "layout": self.layout_pool and self.layout_pool.stats,
+                           "cache": ap.cache_stats,
+                           "prefetch": ap.prefetch_stats,
+                           "executor": ap.providers[0].executor.stats,
+                           "trace": Tracer.shared().stats})
 
 if __name__ == '__main__':
+    import sys, timeit
     wi = GraphvizWebInterface()
     
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        # Request latency of show, e.g. for a root: --benchmark 14:7015
+        rid = sys.argv[2] if len(sys.argv) > 2 else "14:7015"
+        t = min(timeit.repeat(lambda: wi.show(rid), number = 10, repeat = 3)) / 10
+        print "show?rid=%s: %.1f ms/request" % (rid, t * 1000)
+        sys.exit()
+
     cherrypy.quickstart(wi, '/', "cherrypy.conf")
         
\ No newline at end of file
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import multiprocessing, os, shlex, signal, subprocess, time
+from collections import defaultdict, deque
+from threading import Lock, Timer
+
+class LayoutError(RuntimeError):
+    """ Raised if a layout job has been rejected or has timed out """
+    pass
+
+
+class LayoutPool(object):
+    """
+    Pool of processes running graphviz layouts, keeping the CPU bound layout
+    off the request threads.
+
+    At most max_queued jobs are waiting or running, further jobs are
+    rejected. Jobs not finished after timeout seconds fail, their graphviz
+    process is killed by the worker. Graphs of more than dot_above nodes
+    are layouted with dot instead of neato, graphs of more than
+    simplify_above nodes should be simplified before, see GraphvizRenderer.
+
+    Layout times are recorded per graph size, see stats. The pool forks its
+    processes on creation, so create it before starting any threads.
+
+    """
+    # Upper bounds of the graph sizes (in nodes) layout times are grouped by
+    SIZE_BUCKETS = (50, 150, 400)
+
+    def __init__(self, processes = 2, timeout = 10.0, max_queued = 20,
+                 dot_above = 150, simplify_above = 400):
+        self.timeout = timeout
+        self.max_queued = max_queued
+        self.dot_above = dot_above
+        self.simplify_above = simplify_above
+        self.pool = multiprocessing.Pool(processes)
+        self.lock = Lock()
+        self.n_pending = 0
+        # Size bucket -> recent layout times
+        self.times = defaultdict(lambda: deque(maxlen = 1000))
+        # Counters
+        self.rejected = 0
+        self.timeouts = 0
+
+    def prog_for(self, n_nodes):
+        """ Returns the graphviz layout program for a graph of n_nodes """
+        return "dot" if n_nodes > self.dot_above else "neato"
+
+    def render(self, source, format, prog, n_nodes, args = ""):
+        """
+        Layouts the graph given in dot language with prog (called with given
+        args) and returns it in given format. Raises a LayoutError if the job
+        is rejected or if it times out.
+
+        """
+        with self.lock:
+            if self.n_pending >= self.max_queued:
+                self.rejected += 1
+                raise LayoutError("%d layout jobs pending" % self.n_pending)
+            self.n_pending += 1
+
+        t = time.time()
+        try:
+            res = self.pool.apply_async(_layout, (source, format, prog, args,
+                                                  self.timeout))
+            s = res.get(self.timeout)
+        except multiprocessing.TimeoutError:
+            with self.lock:
+                self.timeouts += 1
+            raise LayoutError("Layout of %d nodes timed out" % n_nodes)
+        finally:
+            with self.lock:
+                self.n_pending -= 1
+
+        with self.lock:
+            self.times[self._bucket(n_nodes)].append(time.time() - t)
+        return s
+
+    def _bucket(self, n_nodes):
+        return next((b for b in self.SIZE_BUCKETS if n_nodes <= b), None)
+
+    @property
+    def stats(self):
+        """
+        Returns a dictionary of counters and of p50 and p95 layout times in
+        seconds per graph size, e.g. "<=150" for graphs of 51 to 150 nodes
+
+        """
+        with self.lock:
+            stats = {"pending": self.n_pending, "rejected": self.rejected,
+                     "timeouts": self.timeouts}
+            for (b, times) in self.times.iteritems():
+                times = sorted(times)
+                name = "<=%d" % b if b else ">%d" % self.SIZE_BUCKETS[-1]
+                stats[name] = {"n": len(times),
+                               "p50": times[int(0.5 * (len(times) - 1))],
+                               "p95": times[int(0.95 * (len(times) - 1))]}
+        return stats
+
+    def close(self):
+        self.pool.terminate()
+
+
+def _layout(source, format, prog, args, timeout):
+    # Runs graphviz as pygraphviz.AGraph.draw() would, but in its own process
+    # group, which is killed if it runs too long, so that no graphviz process
+    # outlives its job
+    if isinstance(source, unicode):
+        source = source.encode("utf-8")
+    p = subprocess.Popen([prog, "-T" + format] + shlex.split(args),
+                         stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+                         stderr = subprocess.PIPE, preexec_fn = os.setpgrp)
+    timer = Timer(timeout, _kill_group, (p.pid, ))
+    timer.start()
+    try:
+        (out, err) = p.communicate(source)
+    finally:
+        timer.cancel()
+    if p.returncode < 0:
+        raise LayoutError("%s timed out" % prog)
+    if p.returncode:
+        raise LayoutError("%s failed: %s" % (prog, err.strip()))
+    return out
+
+def _kill_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except OSError:
+        # Already finished
+        pass
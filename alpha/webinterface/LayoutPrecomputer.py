@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import sys, time, argparse
+from threading import Lock
+
+from awg import ArabicWordGraph
+from GraphvizRenderer import GraphvizRenderer
+
+class LayoutPrecomputer(object):
+    """
+    Computes the layout of the graphs of roots once and stores the node
+    positions with the root (see ArabicWordGraph.set_layout), so that
+    GraphvizRenderer can draw them without running a layout.
+
+    Call watch() to collect the roots affected by writes to the graph and
+    recompute_changed() to update their layouts, e.g. after an import.
+
+    """
+    def __init__(self, graph = None):
+        if not graph:
+            graph = ArabicWordGraph()
+        self.graph = graph
+        self.lock = Lock()
+        # Rids of nodes created or connected since the last recomputation
+        self.changed_rids = set()
+
+    def compute(self, root_rid):
+        """ Computes and stores the layout of the graph of given root """
+        renderer = GraphvizRenderer(self.graph)
+        renderer.build_graph_for_node(root_rid)
+        if renderer.result_nodes:
+            self.graph.set_layout(root_rid, renderer.layout_positions)
+
+    def compute_all(self):
+        """ Computes the layouts of all roots, returns their number """
+        t = time.time()
+        roots = [r.rid for r in self.graph.get_roots().primary_results]
+        for (i, rid) in enumerate(roots):
+            self.compute(rid)
+            sys.stdout.write("\rComputed %d layouts (%.1f roots/s)"
+                             % (i + 1, (i + 1) / (time.time() - t)))
+            sys.stdout.flush()
+        sys.stdout.write("\n")
+        return len(roots)
+
+    def roots_of(self, rids, chunk_size = 100):
+        """
+        Returns the rids of the roots of the given nodes. Nodes not found
+        (e.g. without edges) and ForeignNodes are ignored. Raises a
+        RuntimeError if no root is connected to some other node.
+
+        """
+        rids = list(rids)
+        roots = set()
+        for i in range(0, len(rids), chunk_size):
+            # Nodes are returned once per adjacent edge, so the result must
+            # not be limited
+            rs = self.graph.get_topology(rids[i:i + chunk_size], limit = -1)
+            for n in rs.primary_results:
+                if n.cls == "ForeignNode":
+                    continue
+                node_roots = self._connected_roots(n)
+                if not node_roots:
+                    raise RuntimeError("No root found for node %s" % n.rid)
+                roots.update(node_roots)
+        return sorted(roots)
+
+    @staticmethod
+    def _connected_roots(node):
+        """
+        Returns the rids of the roots connected to node in its ResultSet, not
+        passing ForeignNodes, like the traversal of get_topology()
+        
+        """
+        (roots, seen, stack) = (set(), set([node.rid]), [node])
+        while stack:
+            n = stack.pop()
+            if n.cls == "Root":
+                roots.add(n.rid)
+            if n.cls == "ForeignNode":
+                continue
+            for m in n.both:
+                if m is not None and m.rid not in seen:
+                    seen.add(m.rid)
+                    stack.append(m)
+        return roots
+
+    ## ---------------------------------------------------------------------
+    ## Change hook
+
+    def watch(self, graph = None):
+        """ Collects the nodes changed by writes to graph (default: own) """
+        (graph or self.graph).add_change_listener(self._on_change)
+
+    def _on_change(self, rids):
+        with self.lock:
+            self.changed_rids.update(rids)
+
+    def recompute_changed(self):
+        """
+        Recomputes the layouts of the roots of the nodes changed since the
+        last call, returns the number of recomputed roots.
+
+        """
+        with self.lock:
+            rids = self.changed_rids
+            self.changed_rids = set()
+        if not rids:
+            return 0
+        roots = self.roots_of(rids)
+        for rid in roots:
+            self.compute(rid)
+        return len(roots)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description = "Precomputes the layouts of the graphs of roots")
+    parser.add_argument("rids", nargs = "*",
+                        help = "roots or nodes whose roots to recompute "
+                               "(default: all roots)")
+    args = parser.parse_args()
+
+    p = LayoutPrecomputer()
+    if args.rids:
+        for rid in p.roots_of(args.rids):
+            p.compute(rid)
+    else:
+        p.compute_all()
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import hashlib, os, tempfile
+from collections import OrderedDict
+from threading import Lock
+
+class RenderCache(object):
+    """
+    Cache of rendered graphs, used by GraphvizRenderer to skip the layout.
+
+    Entries are stored under a key, e.g. (rid, view, format, renderer
+    version), along with a fingerprint of the rendered objects (their rids
+    and versions). An entry is only returned if the fingerprint matches, so
+    entries are invalidated as soon as a drawn node or edge changes.
+
+    The max_size most recently used entries are kept in memory. If directory
+    is given, all entries are also stored there, one file per key, so that
+    they survive restarts.
+
+    """
+    def __init__(self, max_size = 500, directory = None):
+        self.max_size = max_size
+        self.directory = directory
+        # key -> (fingerprint, rendered graph)
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, key, fingerprint):
+        """
+        Returns the rendered graph stored for key or None if there is none or
+        if it has been rendered from objects with a different fingerprint.
+
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        from_disk = not entry
+        if from_disk:
+            entry = self._read(key)
+
+        with self.lock:
+            if not entry or entry[0] != fingerprint:
+                self.misses += 1
+                self.invalidations += entry is not None
+                return None
+            # Re-insert as most recently used
+            self.entries[key] = entry
+            self._evict()
+            self.hits += 1
+            self.disk_hits += from_disk
+        return entry[1]
+
+    def put(self, key, fingerprint, s):
+        """ Stores the rendered graph s for key """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (fingerprint, s)
+            self._evict()
+        self._write(key, fingerprint, s)
+
+    def _evict(self):
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last = False)
+
+    ## ---------------------------------------------------------------------
+    ## Disk tier
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key)).hexdigest())
+
+    def _read(self, key):
+        """ Returns a pair (fingerprint, rendered graph) or None """
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                return (f.readline().rstrip("\n"), f.read())
+        except IOError:
+            return None
+
+    def _write(self, key, fingerprint, s):
+        if not self.directory:
+            return
+        # Write atomically, concurrent readers see the old or the new entry
+        (fd, tmp_fn) = tempfile.mkstemp(dir = self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(fingerprint + "\n")
+            f.write(s)
+        os.rename(tmp_fn, self._path(key))
+
+    @property
+    def stats(self):
+        """ Returns a dictionary of counters """
+        return {"size": len(self.entries), "hits": self.hits,
+                "disk_hits": self.disk_hits, "misses": self.misses,
+                "invalidations": self.invalidations}
@@ -8,6 +8,7 @@ import cherrypy
 from Cheetah.Template import Template
 from WebInterface import WebInterface
 from pyarabic import araby
+from awg import Tracer, traced_request
 
 class TextWebInterface(WebInterface):
     """
@@ -18,6 +19,7 @@ class TextWebInterface(WebInterface):
         raise cherrypy.HTTPRedirect("show?rid=14:7015")
 
     @cherrypy.expose
+    @traced_request("tx/search")
     def search(self, q):
         if not q:
             return self.instantiate_template([], q)
@@ -35,6 +37,7 @@ class TextWebInterface(WebInterface):
         return self.instantiate_template(res.primary_results, q)
     
     @cherrypy.expose
+    @traced_request("tx/show")
     def show(self, rid):
         rid = "#" + rid
         res = self.graph.get_nodes([rid], True)
@@ -51,9 +54,10 @@ class TextWebInterface(WebInterface):
     def instantiate_template(self, nodes_to_render, query):
         vars = {"nodes_to_render": nodes_to_render, "query": query,
                 "ap": self.agglomeration_provider}
-        tmpl = file("web/templates/textview.tmpl").read().decode("utf-8")
-        t = Template(tmpl, searchList = [vars])
-        return unicode(t).encode("utf8")
+        with Tracer.shared().span("template"):
+            tmpl = file("web/templates/textview.tmpl").read().decode("utf-8")
+            t = Template(tmpl, searchList = [vars])
+            return unicode(t).encode("utf8")
 
 if __name__ == '__main__':
     wi = TextWebInterface()
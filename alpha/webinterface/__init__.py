@@ -1,2 +1,5 @@
 from GraphvizWebInterface import GraphvizWebInterface
-from TextWebInterface import TextWebInterface
\ No newline at end of file
+from TextWebInterface import TextWebInterface
+from RenderCache import RenderCache
+from LayoutPool import LayoutPool
+from LayoutPrecomputer import LayoutPrecomputer
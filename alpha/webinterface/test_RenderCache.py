@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import shutil, tempfile, unittest
+from RenderCache import RenderCache
+
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_hit_and_miss(self):
+        c = RenderCache()
+        self.assertIsNone(c.get("a", "#1:1@1"))
+        c.put("a", "#1:1@1", "<svg/>")
+        self.assertEqual(c.get("a", "#1:1@1"), "<svg/>")
+        self.assertIsNone(c.get("b", "#1:1@1"))
+        self.assertEqual(c.stats, {"size": 1, "hits": 1, "disk_hits": 0,
+                                   "misses": 2, "invalidations": 0})
+
+    def test_fingerprint_mismatch_invalidates(self):
+        c = RenderCache()
+        c.put("a", "#1:1@1", "<svg/>")
+        self.assertIsNone(c.get("a", "#1:1@2"))
+        self.assertEqual(c.stats["invalidations"], 1)
+        self.assertEqual(c.stats["size"], 0)
+        self.assertIsNone(c.get("a", "#1:1@1"))
+
+    def test_eviction(self):
+        c = RenderCache(max_size = 2)
+        c.put("a", "f", "A")
+        c.put("b", "f", "B")
+        c.get("a", "f")
+        c.put("c", "f", "C")
+        self.assertEqual(list(c.entries), ["a", "c"])
+        self.assertIsNone(c.get("b", "f"))
+
+    def test_disk_tier(self):
+        c = RenderCache(max_size = 1, directory = self.dir)
+        c.put(("#1:1", "svg"), "f", "A\nB")
+        c.put(("#1:2", "svg"), "f", "C")
+        # Evicted from memory, read from disk and kept in memory again
+        self.assertEqual(c.get(("#1:1", "svg"), "f"), "A\nB")
+        self.assertEqual(c.stats["disk_hits"], 1)
+        self.assertEqual(list(c.entries), [("#1:1", "svg")])
+
+        # Entries survive restarts
+        c = RenderCache(directory = self.dir)
+        self.assertEqual(c.get(("#1:2", "svg"), "f"), "C")
+        self.assertIsNone(c.get(("#1:2", "svg"), "g"))
+        self.assertEqual(c.stats["disk_hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,11 +6,28 @@ Created on Feb 9, 2016
 @author: mirko
 '''
 
-import json, sys
+import json, sys, time, resource
+from array import array
 from collections import defaultdict
 from pyarabic import araby
 
-class ArabicDictionaryEntry:
+## Table of interned unicode strings, see intern_string()
+_interned_strings = {}
+
+def intern_string(s):
+    """
+    Returns the canonical instance of the given string, like intern(), but
+    working for unicode strings, too.
+    
+    """
+    return _interned_strings.setdefault(s, s)
+
+
+class ArabicDictionaryEntry(object):
+    # Entries are numerous, avoid having a __dict__ per instance
+    __slots__ = ("citation_form", "entry_type", "root", "pattern", "stem",
+                 "translations", "_metadata")
+
     ROMAN_TO_INT = defaultdict(int, {
         "I": 1, "II": 2, "III": 3, "IV": 4, "V": 5, "VI": 6,
         "VII": 7, "VIII": 8, "IX": 9, "X": 10})
@@ -27,20 +44,37 @@ class ArabicDictionaryEntry:
         - translations: array of strings
         - metadata: dictionary
         
+        Strings shared between many entries are interned, translations are
+        stored as a tuple.
+        
         """
         self.citation_form = citation_form
-        self.entry_type = entry_type
-        self.root = root
-        self.pattern = pattern
+        self.entry_type = intern_string(entry_type)
+        self.root = intern_string(root)
+        self.pattern = intern_string(pattern)
         self.stem = stem
-        self.translations = translations
-        if not metadata:
-            metadata = {}
-        self.metadata = metadata
+        self.translations = tuple(intern_string(t) for t in translations)
+        self._metadata = metadata
+
+    @property
+    def metadata(self):
+        """ Returns the metadata dictionary, creating it on first access """
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
 
 
     @staticmethod
     def from_elixirfm_json(data):
+        return ArabicDictionaryEntry(*ArabicDictionaryEntry.parse_elixirfm_json(data))
+
+    @staticmethod
+    def parse_elixirfm_json(data):
+        """
+        Returns the fields of the entry given as ElixirFM json, i.e. the
+        arguments of __init__() up to translations, without creating an entry.
+        
+        """
         if len(data) > 2:
             # FIXME
             # For Verbs: Imperative form (imperfect vocal), Masdar
@@ -58,8 +92,7 @@ class ArabicDictionaryEntry:
         # If no stem info is given, use 0
         stem = ArabicDictionaryEntry.ROMAN_TO_INT[data[1:-1]]
         
-        node = ArabicDictionaryEntry(citation_form, entry_type, root, pattern, stem, translations)
-        return node
+        return (citation_form, entry_type, root, pattern, stem, translations)
 
     def get_surface_forms(self):
         """
@@ -81,15 +114,41 @@ class ArabicDictionaryEntry:
 
 class ArabicDictionary:
     def __init__(self):
-        # Array of ArabicDictionaryEntry objects
+        # Array of ArabicDictionaryEntry objects, the index is the entry id
         self.entries = []
         # Set of known roots
         self.roots = set([])
-        # Dictionary: vocalized surface form -> array of ArabicDictionaryEntry objects
+        # Dictionary: vocalized surface form -> array of entry ids
         #   populated with plural, feminine forms, etc., too
-        self.entries_by_surface_form = defaultdict(list)
+        self.entries_by_surface_form = defaultdict(lambda: array("I"))
+
+    @staticmethod
+    def from_snapshot(snapshot, entries = None):
+        """
+        Creates an ArabicDictionary from a LexiconSnapshot without parsing the
+        dump. Pass the snapshot's entries if they have already been created.
+        
+        """
+        if entries is None:
+            entries = snapshot.entries(ArabicDictionaryEntry)
+        d = ArabicDictionary()
+        d.entries = entries[:snapshot.n_lexicon_entries]
+        d.roots = set(e.root for e in d.entries)
+        d.entries_by_surface_form.update(snapshot.surface_index)
+        return d
 
     def import_dump(self, fn):
+        """ Adds all entries of the ElixirFM json dump at fn """
+        for entry in self.iter_entries(fn):
+            self.add_entry(entry)
+
+    @staticmethod
+    def iter_entries(fn, parse = ArabicDictionaryEntry.from_elixirfm_json):
+        """
+        Yields the entries of the ElixirFM json dump at fn, created from the
+        json of each derivation by parse.
+        
+        """
         raw = json.load(open(fn), "utf-8")
         
         def flatten(a):
@@ -106,10 +165,11 @@ class ArabicDictionary:
             derivations = r[1][1:]
             for e in derivations:
                 try:
-                    entry = ArabicDictionaryEntry.from_elixirfm_json(e)
-                    self.add_entry(entry)
+                    entry = parse(e)
                 except:
                     print "Error parsing derivation from root id %s" % root_id
+                    continue
+                yield entry
                     
     def add_entry(self, entry):
         """
@@ -117,12 +177,15 @@ class ArabicDictionary:
         entries_by_surface_form.
         
         """
+        entry_id = len(self.entries)
         self.entries.append(entry)
         self.roots.add(entry.root)
         for s in entry.get_surface_forms():
             # Add vocalized and non-vocalized forms
-            self.entries_by_surface_form[s].append(entry)
-            self.entries_by_surface_form[araby.strip_tashkeel(s)].append(entry)
+            self.entries_by_surface_form[s].append(entry_id)
+            unvocalized = araby.strip_tashkeel(s)
+            if unvocalized != s:
+                self.entries_by_surface_form[unvocalized].append(entry_id)
         
     def search(self, citation_form):
         """
@@ -133,13 +196,69 @@ class ArabicDictionary:
         if citation_form not in self.entries_by_surface_form:
             citation_form = araby.strip_tashkeel(citation_form)
 
-        try:
-            return self.entries_by_surface_form[citation_form]
-        except IndexError:
-            return []
+        entry_ids = self.entries_by_surface_form.get(citation_form, ())
+        return [self.entries[i] for i in entry_ids]
         
 if __name__ == '__main__':
+    import os
+
+    def load_baseline(fn):
+        """
+        Loads the dump at fn into the representation used before entries had
+        slots: a dict per entry (the instance __dict__ of a classic class)
+        with its own metadata dict, translations as list, no interned strings
+        and the surface form index holding lists of entries.
+        
+        """
+        fields = ("citation_form", "entry_type", "root", "pattern", "stem",
+                  "translations")
+        def parse(e):
+            d = dict(zip(fields, ArabicDictionaryEntry.parse_elixirfm_json(e)))
+            d["metadata"] = {}
+            return d
+        entries = []
+        entries_by_surface_form = defaultdict(list)
+        for d in ArabicDictionary.iter_entries(fn, parse):
+            entries.append(d)
+            s = d["citation_form"]
+            entries_by_surface_form[s].append(d)
+            entries_by_surface_form[araby.strip_tashkeel(s)].append(d)
+        return entries
+
+    def load(fn):
+        l = ArabicDictionary()
+        l.import_dump(fn)
+        return l.entries
+
+    def measure(f, fn):
+        """
+        Runs f(fn) in a child process, so that the max RSS of each
+        representation is measured on its own. Returns the number of entries,
+        the seconds taken and the growth of max RSS in MB.
+        
+        """
+        (r, w) = os.pipe()
+        if os.fork() == 0:
+            try:
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                t0 = time.time()
+                n = len(f(fn))
+                os.write(w, "%d %f %d" % (n, time.time() - t0,
+                    (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024))
+            finally:
+                os._exit(0)
+        os.close(w)
+        result = os.read(r, 100).split()
+        os.wait()
+        if not result:
+            raise RuntimeError("Loading %s failed" % fn)
+        return (int(result[0]), float(result[1]), int(result[2]))
+
     fn = sys.argv[1]
+    for (name, f) in (("dict entries (baseline)", load_baseline),
+                      ("slotted entries", load)):
+        print "%s: loaded %d entries in %.1fs, max RSS grew by %d MB" \
+                % ((name, ) + measure(f, fn))
     l = ArabicDictionary()
     l.import_dump(fn)
     res = l.search(u"لاسلكي")    
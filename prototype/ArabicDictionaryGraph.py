@@ -12,6 +12,7 @@ import pygraphviz as pgv
 from collections import defaultdict
 
 from ArabicDictionary import ArabicDictionary, ArabicDictionaryEntry
+from LexiconSnapshot import LexiconSnapshot, file_hash
 
 class DictionaryNodeBase(object):
     last_id = 0
@@ -208,13 +209,35 @@ class DirectedEdge(object):
 class ArabicDictionaryGraph:
     GRAPHVIZ_PARAMS = {"directed": True, "overlap": "scale"}
     
-    def __init__(self, lexicon):
-        """ Create a LexiconGraph from a Lexicon """
+    def __init__(self, lexicon, snapshot = None, entries = None):
+        """
+        Create a LexiconGraph from a Lexicon. If a LexiconSnapshot containing
+        a graph is passed, the graph is restored from it instead of being
+        built from scratch (entries as in ArabicDictionary.from_snapshot).
+        
+        """
         self.lexicon = lexicon
         self.nodes = []
         self.edges = []
         
-        self.__create_graph()
+        if snapshot and snapshot.has_graph:
+            self.__restore_graph(snapshot, entries)
+        else:
+            self.__create_graph()
+
+    def __restore_graph(self, snapshot, entries):
+        if entries is None:
+            entries = self.lexicon.entries
+        node_classes = {"DictionaryNode": DictionaryNode,
+                        "StemNode": StemNode, "RootNode": RootNode}
+        for (kind, x) in snapshot.nodes:
+            if kind == "RootNode":
+                self.nodes.append(RootNode(x))
+            else:
+                self.nodes.append(node_classes[kind](entries[x]))
+        for (source, target, label) in snapshot.edges:
+            self.edges.append(DirectedEdge(self.nodes[source],
+                                           self.nodes[target], label))
 
     def __create_graph(self):
         entries_by_roots = defaultdict(list)
@@ -236,11 +259,34 @@ class ArabicDictionaryGraph:
         entries = self.lexicon.search(s)
         return [e.metadata["node"] for e in entries]
 
-if __name__ == '__main__':
-    fn = sys.argv[1]
+
+def load_graph(fn, snapshot_fn = None):
+    """
+    Returns a pair (ArabicDictionary, ArabicDictionaryGraph) for the ElixirFM
+    dump at fn. Both are loaded from the snapshot at snapshot_fn (defaults to
+    fn + ".snapshot") unless it is missing or has been created from a
+    different dump. In this case, the dump is parsed and the snapshot is
+    (re-)created.
+    
+    """
+    if not snapshot_fn:
+        snapshot_fn = fn + ".snapshot"
+    h = file_hash(fn)
+    snapshot = LexiconSnapshot.load(snapshot_fn, h)
+    if snapshot and snapshot.has_graph:
+        entries = snapshot.entries(ArabicDictionaryEntry)
+        l = ArabicDictionary.from_snapshot(snapshot, entries)
+        return (l, ArabicDictionaryGraph(l, snapshot, entries))
+
     l = ArabicDictionary()
     l.import_dump(fn)
     lg = ArabicDictionaryGraph(l)
+    LexiconSnapshot.create(snapshot_fn, h, l, lg)
+    return (l, lg)
+
+if __name__ == '__main__':
+    fn = sys.argv[1]
+    (l, lg) = load_graph(fn)
     G = lg.draw(lg.nodes[-1], 4)
     #engines = ("dot", "neato", "sfdp", "fdp", "twopi", "circo")
     engines = ("neato", )
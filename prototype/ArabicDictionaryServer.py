@@ -5,15 +5,13 @@ Bla bal
 
 @author:     Mirko Vogel
 '''
-import sys, os
+import sys
 import langenscheid_lookup
 
 import cherrypy, cherrypy.lib.static
-import tempfile
 from Cheetah.Template import Template
 
-from ArabicDictionary import ArabicDictionary
-from ArabicDictionaryGraph import ArabicDictionaryGraph
+from ArabicDictionaryGraph import load_graph
 
 
 class ArabicDictionaryServer(object):
@@ -41,11 +39,8 @@ class ArabicDictionaryServer(object):
 
     def _show(self, center_node):
         G = self.adg.draw(center_node, 2)
-        
-        path = tempfile.mktemp(suffix = ".svg")
-        G.draw(path, format = "svg", prog = "neato")
-        svg_lines = open(path).readlines()
-        os.unlink(path)
+        # Without a path, graphviz output is piped back instead of written
+        svg = G.draw(format = "svg", prog = "neato")
         
         try:
             li = langenscheid_lookup.lookup(center_node.entry.citation_form)
@@ -53,7 +48,7 @@ class ArabicDictionaryServer(object):
             li = []
             
         vars = { "entry": center_node.entry, "langenscheidt_info": li,
-                 "svg": "\n".join(svg_lines[6:]) }
+                 "svg": svg[svg.index("<svg"):] }
         
         tmpl = file("templates/show_entry.tmpl").read().decode("utf-8")
         t = Template(tmpl, searchList = [vars])
@@ -61,9 +56,7 @@ class ArabicDictionaryServer(object):
 
     
 if __name__ == '__main__':
-    l = ArabicDictionary()
-    l.import_dump(sys.argv[1])
-    adg = ArabicDictionaryGraph(l)
+    (l, adg) = load_graph(sys.argv[1])
     server = ArabicDictionaryServer(adg)
     
     cherrypy.quickstart(server, '/', "cherrypy.conf")
\ No newline at end of file
@@ -0,0 +1,269 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import hashlib, mmap, os, struct, sys
+from array import array
+
+class LexiconSnapshot(object):
+    """
+    Binary snapshot of an ArabicDictionary and its ArabicDictionaryGraph,
+    allowing to skip parsing the ElixirFM dump and building the graph.
+
+    The file consists of a header (magic, format version, byte order, hash of
+    the dump the snapshot was created from) followed by named sections, each
+    holding a flat array of integers or the utf-8 encoded string table. All
+    strings are referred to by their index in the string table. Strings which
+    were byte strings (str) are restored as such, all others as unicode.
+
+    Sections:
+    - strings: "\\0"-separated string table
+    - str_ids: ids of the strings to be restored as str
+    - entries: 6 ints per entry: citation form, entry type, root, pattern,
+      stem, number of translations
+    - transl: string ids of the translations of all entries, concatenated
+    - n_lex: number of entries belonging to the lexicon, the remaining ones
+      are only referred to by graph nodes (invented verbs)
+    - index: the lexicon's surface form index, for each surface form its
+      string id, the number of entries and their ids
+    - nodes: 2 ints per graph node: kind (see NODE_KINDS) and entry id or,
+      for root nodes, root string id
+    - edges: 4 ints per graph edge: source node, target node, label kind
+      (0: string, 1: integer, e.g. a stem) and label string id or integer
+
+    """
+    MAGIC = "SHBKLEX\0"
+    VERSION = 2
+    HEADER = struct.Struct("!8sIc40s")
+    SECTION_HEADER = struct.Struct("!8scQ")
+    NODE_KINDS = ("DictionaryNode", "StemNode", "RootNode")
+
+    def __init__(self):
+        self.strings = []
+        self.sections = {}
+
+    ## ---------------------------------------------------------------------
+    ## Creating snapshots
+
+    @staticmethod
+    def create(fn, source_hash, lexicon, graph = None):
+        """
+        Writes a snapshot of lexicon and, optionally, graph to fn. The file is
+        written to a temporary file first and renamed, so that readers never
+        see partial snapshots.
+
+        """
+        # (is str, unicode string) -> string id, as "a" == u"a"
+        string_ids = {}
+        def sid(s):
+            key = (isinstance(s, str), s.decode("utf-8")
+                   if isinstance(s, str) else unicode(s))
+            if key not in string_ids:
+                string_ids[key] = len(string_ids)
+            return string_ids[key]
+
+        entries, translations = array("I"), array("I")
+        entry_ids = {}
+        def add_entry(e):
+            entry_ids[id(e)] = len(entry_ids)
+            entries.extend((sid(e.citation_form), sid(e.entry_type), sid(e.root),
+                            sid(e.pattern), e.stem, len(e.translations)))
+            translations.extend(sid(t) for t in e.translations)
+
+        for e in lexicon.entries:
+            add_entry(e)
+        n_lex = array("I", [len(entry_ids)])
+
+        index = array("I")
+        for (form, ids) in lexicon.entries_by_surface_form.iteritems():
+            index.extend((sid(form), len(ids)))
+            index.extend(ids)
+
+        nodes, edges = array("I"), array("I")
+        if graph:
+            node_ids = {}
+            for n in graph.nodes:
+                node_ids[id(n)] = len(node_ids)
+                kind = type(n).__name__
+                if kind == "RootNode":
+                    nodes.extend((2, sid(n.root)))
+                    continue
+                if id(n.entry) not in entry_ids:
+                    add_entry(n.entry)
+                nodes.extend((LexiconSnapshot.NODE_KINDS.index(kind),
+                              entry_ids[id(n.entry)]))
+            for e in graph.edges:
+                is_int = isinstance(e.label, (int, long))
+                edges.extend((node_ids[id(e.source)], node_ids[id(e.target)],
+                              int(is_int), e.label if is_int else sid(e.label)))
+
+        strings = sorted(string_ids, key = string_ids.get)
+        str_ids = array("I", (i for (i, (is_str, _)) in enumerate(strings)
+                              if is_str))
+        sections = [("strings", "B", u"\0".join(s for (_, s) in strings)
+                                        .encode("utf-8")),
+                    ("str_ids", "I", str_ids),
+                    ("entries", "I", entries), ("transl", "I", translations),
+                    ("n_lex", "I", n_lex), ("index", "I", index),
+                    ("nodes", "I", nodes), ("edges", "I", edges)]
+
+        tmp_fn = "%s.%d.tmp" % (fn, os.getpid())
+        with open(tmp_fn, "wb") as f:
+            f.write(LexiconSnapshot.HEADER.pack(LexiconSnapshot.MAGIC,
+                LexiconSnapshot.VERSION, sys.byteorder[0], source_hash))
+            for (name, typecode, data) in sections:
+                if isinstance(data, array):
+                    data = data.tostring()
+                f.write(LexiconSnapshot.SECTION_HEADER.pack(name, typecode,
+                                                            len(data)))
+                f.write(data)
+        os.rename(tmp_fn, fn)
+
+    ## ---------------------------------------------------------------------
+    ## Loading snapshots
+
+    @staticmethod
+    def load(fn, source_hash):
+        """
+        Reads the snapshot at fn and returns a LexiconSnapshot. Returns None
+        if there is no such file or if it is stale, i.e. its format version,
+        its byte order or the hash of its source do not match.
+
+        The file is memory mapped, but every section is copied into an array
+        and the mapping is closed again: Python 2 arrays cannot be views of a
+        mmap, and restoring the graph needs all entries anyway, see
+        entries(). The gain over parsing the dump is skipping the json
+        decoding and graph building, see the benchmark in __main__.
+
+        """
+        if not os.path.exists(fn):
+            return None
+
+        with open(fn, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            (magic, version, byteorder, h) = LexiconSnapshot.HEADER.unpack_from(mm)
+            if (magic, version, byteorder, h) != (LexiconSnapshot.MAGIC,
+                    LexiconSnapshot.VERSION, sys.byteorder[0], source_hash):
+                return None
+
+            snapshot = LexiconSnapshot()
+            pos = LexiconSnapshot.HEADER.size
+            while pos < len(mm):
+                (name, typecode, l) = LexiconSnapshot.SECTION_HEADER.unpack_from(mm, pos)
+                pos += LexiconSnapshot.SECTION_HEADER.size
+                a = array(typecode)
+                a.fromstring(mm[pos:pos + l])
+                snapshot.sections[name.rstrip("\0")] = a
+                pos += l
+        finally:
+            mm.close()
+
+        strings = snapshot.sections.pop("strings").tostring()
+        snapshot.strings = strings.decode("utf-8").split(u"\0")
+        for i in snapshot.sections.pop("str_ids"):
+            snapshot.strings[i] = snapshot.strings[i].encode("utf-8")
+        return snapshot
+
+    def entries(self, entry_class):
+        """ Returns the list of entries, created by calling entry_class """
+        s, translations = self.strings, self.sections["transl"]
+        data = self.sections["entries"]
+        entries = []
+        pos = 0
+        for i in xrange(0, len(data), 6):
+            (c, t, r, p, stem, n) = data[i:i + 6]
+            entries.append(entry_class(s[c], s[t], s[r], s[p], int(stem),
+                                       [s[x] for x in translations[pos:pos + n]]))
+            pos += n
+        return entries
+
+    @property
+    def n_lexicon_entries(self):
+        """ Returns the number of entries belonging to the lexicon """
+        return self.sections["n_lex"][0]
+
+    @property
+    def surface_index(self):
+        """ Yields (surface form, array of entry ids) pairs """
+        data = self.sections["index"]
+        i = 0
+        while i < len(data):
+            n = data[i + 1]
+            yield (self.strings[data[i]], data[i + 2:i + 2 + n])
+            i += 2 + n
+
+    @property
+    def has_graph(self):
+        return len(self.sections["nodes"]) > 0
+
+    @property
+    def nodes(self):
+        """ Yields (node kind, entry id or root string) pairs """
+        data = self.sections["nodes"]
+        for i in xrange(0, len(data), 2):
+            kind = self.NODE_KINDS[data[i]]
+            yield (kind, self.strings[data[i + 1]] if kind == "RootNode"
+                         else data[i + 1])
+
+    @property
+    def edges(self):
+        """ Yields (source node id, target node id, label) triples """
+        data = self.sections["edges"]
+        for i in xrange(0, len(data), 4):
+            label = data[i + 3]
+            # Items of "I" arrays may come back as long
+            yield (data[i], data[i + 1],
+                   int(label) if data[i + 2] else self.strings[label])
+
+
+def file_hash(fn):
+    """ Returns the sha1 hex digest of the file at fn """
+    h = hashlib.sha1()
+    with open(fn, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), ""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+if __name__ == '__main__':
+    import time
+    from ArabicDictionary import ArabicDictionary, ArabicDictionaryEntry
+    from ArabicDictionaryGraph import ArabicDictionaryGraph
+
+    # Benchmark: building lexicon and graph from the dump vs. from a snapshot
+    fn = sys.argv[1]
+    snapshot_fn = fn + ".snapshot"
+    h = file_hash(fn)
+
+    t0 = time.time()
+    l = ArabicDictionary()
+    l.import_dump(fn)
+    lg = ArabicDictionaryGraph(l)
+    t1 = time.time()
+    LexiconSnapshot.create(snapshot_fn, h, l, lg)
+    t2 = time.time()
+    print "Parsing the dump and building the graph: %.2fs" % (t1 - t0)
+    print "Writing the snapshot: %.2fs (%d KB)" \
+            % (t2 - t1, os.path.getsize(snapshot_fn) / 1024)
+
+    t0 = time.time()
+    snapshot = LexiconSnapshot.load(snapshot_fn, h)
+    t1 = time.time()
+    entries = snapshot.entries(ArabicDictionaryEntry)
+    t2 = time.time()
+    l2 = ArabicDictionary.from_snapshot(snapshot, entries)
+    lg2 = ArabicDictionaryGraph(l2, snapshot, entries)
+    t3 = time.time()
+    print "Loading the snapshot: %.2fs reading sections, %.2fs creating " \
+          "entries, %.2fs restoring lexicon and graph, %.2fs in total" \
+            % (t1 - t0, t2 - t1, t3 - t2, t3 - t0)
+
+    # Roundtrip keeps the types of labels and strings
+    labels = lambda g: sorted((type(e.label), e.label) for e in g.edges)
+    assert labels(lg) == labels(lg2)
+    fields = lambda e: [(type(x), x) for x in (e.citation_form, e.entry_type,
+                        e.root, e.pattern, e.stem) + e.translations]
+    assert map(fields, l.entries) == map(fields, l2.entries)
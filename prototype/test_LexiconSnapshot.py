@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+'''
+@author: mirko
+'''
+
+import os, shutil, tempfile, unittest
+
+from ArabicDictionary import ArabicDictionary, ArabicDictionaryEntry
+from ArabicDictionaryGraph import ArabicDictionaryGraph, load_graph
+from LexiconSnapshot import LexiconSnapshot, file_hash
+
+DUMP_FN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dump.json")
+
+def entry_fields(e):
+    """ Returns the fields of e along with the types of its strings """
+    fields = (e.citation_form, e.entry_type, e.root, e.pattern, e.stem,
+              e.translations)
+    return (fields, [type(x) for x in fields[:4] + fields[5]])
+
+def graph_summary(g):
+    """ Returns the nodes and edges of g as comparable tuples """
+    ids = dict((id(n), i) for (i, n) in enumerate(g.nodes))
+    nodes = [(type(n).__name__, getattr(n, "root", None) if not
+              getattr(n, "entry", None) else entry_fields(n.entry))
+             for n in g.nodes]
+    edges = [(ids[id(e.source)], ids[id(e.target)], e.label, type(e.label))
+             for e in g.edges]
+    return (nodes, edges)
+
+
+class LexiconSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, "dump.json.snapshot")
+        self.hash = file_hash(DUMP_FN)
+        self.lexicon = ArabicDictionary()
+        self.lexicon.import_dump(DUMP_FN)
+        self.graph = ArabicDictionaryGraph(self.lexicon)
+        LexiconSnapshot.create(self.fn, self.hash, self.lexicon, self.graph)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        snapshot = LexiconSnapshot.load(self.fn, self.hash)
+        entries = snapshot.entries(ArabicDictionaryEntry)
+        l = ArabicDictionary.from_snapshot(snapshot, entries)
+        self.assertEqual(len(l.entries), 59)
+        self.assertEqual(map(entry_fields, l.entries),
+                         map(entry_fields, self.lexicon.entries))
+        self.assertEqual(l.roots, self.lexicon.roots)
+        self.assertEqual(dict((k, list(v)) for (k, v)
+                              in l.entries_by_surface_form.iteritems()),
+                         dict((k, list(v)) for (k, v)
+                              in self.lexicon.entries_by_surface_form.iteritems()))
+
+        g = ArabicDictionaryGraph(l, snapshot, entries)
+        self.assertEqual(graph_summary(g), graph_summary(self.graph))
+
+    def test_stale(self):
+        self.assertIsNone(LexiconSnapshot.load(self.fn, "0" * 40))
+        self.assertIsNone(LexiconSnapshot.load(self.fn + ".missing", self.hash))
+
+    def test_load_graph(self):
+        (l, g) = load_graph(DUMP_FN, self.fn)
+        self.assertEqual(graph_summary(g), graph_summary(self.graph))
+        self.assertEqual(map(entry_fields, l.entries),
+                         map(entry_fields, self.lexicon.entries))
+
+
+if __name__ == "__main__":
+    unittest.main()